@@ -0,0 +1,106 @@
+"""
+Open-event throughput against server.db settings.
+
+"before": default SQLite settings (rollback journal, synchronous=FULL) and three
+commits per open (event, cluster preference, profile embedding), as /open used to do.
+"after": configure_sqlite() (WAL, busy timeout, synchronous=NORMAL) and one
+transaction per open.
+"buffered": tuned settings and OpenEventBuffer (write-behind, one transaction per
+batch); the time includes the final flush.
+
+Runs against throwaway databases in a temporary directory.
+
+python bench_open_events.py [opens]
+"""
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from flask import Flask
+from models import db, ImageEntry, OpenEvent, configure_sqlite
+from recommender import Recommender
+from embedding_store import EmbeddingStore
+from open_events import OpenEventBuffer
+
+IMAGES = 500
+USERS = 20
+
+
+def make_app(path, tuned):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+    with app.app_context():
+        if tuned:
+            configure_sqlite(db.engine)
+        db.create_all()
+        for i in range(IMAGES):
+            db.session.add(ImageEntry(filename=f"img{i}.png", uploader="bench", filepath=f"img{i}.png", cluster=i % 6))
+        db.session.commit()
+    return app
+
+
+def run(app, workdir, opens, single_transaction):
+    rng = np.random.default_rng(0)
+    image_store = EmbeddingStore(os.path.join(workdir, "images.f32"))
+    user_store = EmbeddingStore(os.path.join(workdir, "users.f32"))
+    vectors = rng.normal(size=(IMAGES, image_store.dim)).astype(np.float32)
+    recommender = Recommender(db, image_store, user_store)
+    commit = not single_transaction
+    with app.app_context():
+        clusters = dict(db.session.query(ImageEntry.id, ImageEntry.cluster).all())
+        ids = list(clusters)
+        started = time.perf_counter()
+        for n in range(opens):
+            user = f"user{n % USERS}"
+            image_id = ids[rng.integers(len(ids))]
+            db.session.add(OpenEvent(user=user, image_id=image_id))
+            if commit:
+                db.session.commit()
+            recommender.increment_pref(user, clusters[image_id], commit=commit)
+            recommender.update_profile_embedding(user, vectors[image_id - 1].astype(float), commit=commit)
+            if single_transaction:
+                db.session.commit()
+        return time.perf_counter() - started
+
+
+def run_buffered(app, workdir, opens):
+    rng = np.random.default_rng(0)
+    image_store = EmbeddingStore(os.path.join(workdir, "images.f32"))
+    user_store = EmbeddingStore(os.path.join(workdir, "users.f32"))
+    vectors = rng.normal(size=(IMAGES, image_store.dim)).astype(np.float32)
+    with app.app_context():
+        clusters = dict(db.session.query(ImageEntry.id, ImageEntry.cluster).all())
+    for image_id in clusters:
+        image_store.put(image_id, vectors[image_id - 1])
+    buffer = OpenEventBuffer(app, Recommender(db, image_store, user_store), image_store,
+                             log_dir=os.path.join(workdir, "open_events"))
+    ids = list(clusters)
+    started = time.perf_counter()
+    for n in range(opens):
+        image_id = ids[rng.integers(len(ids))]
+        buffer.record(f"user{n % USERS}", image_id, clusters[image_id])
+    buffer.flush()
+    return time.perf_counter() - started
+
+
+def main(opens):
+    print(f"{'mode':<8} {'opens':>7} {'seconds':>9} {'opens/s':>9}")
+    results = {}
+    for mode, tuned in (("before", False), ("after", True), ("buffered", True)):
+        with tempfile.TemporaryDirectory() as workdir:
+            app = make_app(os.path.join(workdir, "bench.db"), tuned)
+            if mode == "buffered":
+                secs = run_buffered(app, workdir, opens)
+            else:
+                secs = run(app, workdir, opens, single_transaction=tuned)
+            with app.app_context():
+                db.engine.dispose()
+        results[mode] = opens / secs
+        print(f"{mode:<8} {opens:>7} {secs:>9.2f} {opens / secs:>9.1f}")
+    print(f"speedup {results['after'] / results['before']:.1f}x, buffered {results['buffered'] / results['before']:.1f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,75 @@
+"""
+Latency of recommendation scoring against catalogue size.
+Compares the old per-image Python loop with recommender.score_catalogue on synthetic
+data (no database, so the loop's per-image OpenEvent query is not even counted).
+
+python bench_recommender.py [sizes...]
+"""
+import sys
+import time
+import numpy as np
+from recommender import score_catalogue, top_k
+
+DIM = 384
+
+
+def make_catalogue(n, rng):
+    emb = rng.normal(size=(n, DIM)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    return {
+        "clusters": rng.integers(-1, 6, size=n),
+        "age_seconds": rng.uniform(0, 60 * 86400, size=n),
+        "open_counts": rng.poisson(2, size=n).astype(float),
+        "embeddings": emb,
+        "emb_rows": np.arange(n),
+    }
+
+
+def loop_scores(prefs, profile_vec, cat):
+    # same arithmetic as the original recommend_for_user loop
+    pref_total = sum(prefs.values()) if prefs else 0
+    scored = []
+    for i in range(len(cat["clusters"])):
+        pref_score = (prefs.get(f"cluster_{cat['clusters'][i]}", 0) / pref_total) if pref_total > 0 else 0
+        recency_days = int(cat["age_seconds"][i] // 86400)
+        recency_boost = max(0, 1 - (recency_days / 30.0))
+        emb = cat["embeddings"][cat["emb_rows"][i]].tolist()  # the old code parsed a JSON list here
+        sem_score = float(np.dot(profile_vec, np.array(emb, dtype=float)))
+        score = sem_score * 2.5 + pref_score * 2.0 + recency_boost * 0.5 + min(cat["open_counts"][i], 10) * 0.05
+        scored.append((score, i))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [i for _, i in scored[:10]]
+
+
+def vector_scores(prefs, profile_vec, cat):
+    scores, _ = score_catalogue(prefs, profile_vec, cat["clusters"], cat["age_seconds"], cat["open_counts"],
+                                cat["embeddings"], cat["emb_rows"])
+    return top_k(scores, 10).tolist()
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    prefs = {"cluster_1": 3, "cluster_4": 1}
+    profile = rng.normal(size=DIM)
+    profile /= np.linalg.norm(profile)
+    print(f"{'images':>8} {'loop ms':>10} {'vectorized ms':>14} {'speedup':>8}")
+    for n in sizes:
+        cat = make_catalogue(n, rng)
+        t_loop, top_loop = timed(loop_scores, prefs, profile, cat, repeat=1 if n > 20000 else 3)
+        t_vec, top_vec = timed(vector_scores, prefs, profile, cat)
+        same = "" if top_loop == top_vec else "  (top-10 differs!)"
+        print(f"{n:>8} {t_loop * 1000:>10.1f} {t_vec * 1000:>14.2f} {t_loop / t_vec:>7.0f}x{same}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1000, 10000, 100000])
@@ -2,60 +2,180 @@ import json
 import os
 from datetime import datetime
 import hashlib
+import hmac
+import threading
+import time
+from chain_storage import open_storage, migrate, JsonFileStorage
+from miner import ProofOfWorkMiner
+from merkle import merkle_root, merkle_proof, verify_proof
+from chain_index import ChainIndex
+from file_lock import FileLock
 
 class Blockchain:
-    def __init__(self, storage_path="blockchain.json"):
+    def __init__(self, storage_path="blockchain.log", legacy_path="blockchain.json", audit_interval=24 * 3600,
+                 miner=None, mining_timeout=None):
         self.storage_path = storage_path
+        self.storage = open_storage(storage_path)
+        # held while a block is built, mined and appended, so workers sharing the file take turns
+        self.write_lock = FileLock(storage_path + ".lock")
         self.difficulty = 4
+        self.miner = miner or ProofOfWorkMiner(workers=1)
+        self.mining_timeout = mining_timeout
+        # Integrity checkpoints: blocks up to the checkpoint height were verified already
+        self.checkpoint_path = storage_path + ".checkpoint"
+        self.checkpoint_key = os.environ.get("CHAIN_CHECKPOINT_KEY", "").encode() or None
+        self.audit_interval = audit_interval  # seconds between full audits by the audit thread
+        self._audit_lock = FileLock(storage_path + ".audit.lock")  # one worker audits at a time
+        self._audit_thread = None
+        self.audit_stats = {"audits": 0, "last_audit_seconds": 0.0, "last_result": None}
+        self._cached_chain = None
+        self._cached_signature = None
+        self.cache_stats = {"hits": 0, "reloads": 0, "bytes_parsed": 0}
+        # Import a chain kept in the old whole-file JSON format
+        if not self.storage.exists() and legacy_path and legacy_path != storage_path and os.path.exists(legacy_path):
+            n = migrate(legacy_path, storage_path)
+            print(f"Imported {n} blocks from {legacy_path} into {storage_path}")
         # Ensure blockchain file exists
-        if not os.path.exists(self.storage_path):
+        if not self.storage.exists():
             self.save_to_file([self.create_genesis_block()])
+        self.index = ChainIndex(storage_path + ".index")
+        self.index.sync(self._load_cached())
 
     @property
     def chain(self):
-        """Always load the chain from the JSON file."""
-        return self.load_from_file()
+        """The current chain; read from storage only when the file has changed."""
+        return list(self._load_cached())
+
+    def _load_cached(self):
+        signature = self.storage.signature()
+        if self._cached_chain is not None and signature == self._cached_signature:
+            self.cache_stats["hits"] += 1
+            return self._cached_chain
+        self._cached_chain = self.load_from_file()
+        self._cached_signature = signature
+        self.cache_stats["reloads"] += 1
+        self.cache_stats["bytes_parsed"] += signature[1] if signature else 0
+        return self._cached_chain
+
+    def invalidate_cache(self):
+        self._cached_chain = None
+        self._cached_signature = None
+
+    def get_cache_stats(self):
+        stats = dict(self.cache_stats)
+        stats["cached_blocks"] = len(self._cached_chain) if self._cached_chain is not None else 0
+        return stats
 
     def create_genesis_block(self):
         return Block(0, str(datetime.now()), "Genesis Block", "0")
 
     def get_latest_block(self):
-        return self.chain[-1]
+        return self._load_cached()[-1]
 
     def add_block(self, new_data):
-        chain = self.chain  # load latest chain from file
-        if not self.is_chain_valid(chain):
-            raise Exception("The blockchain is compromised! Block was not added.")
-
-        latest_block = chain[-1]
-        new_block = Block(len(chain), str(datetime.now()), new_data, latest_block.hash)
-        new_block.mine_block(self.difficulty)
-        chain.append(new_block)
-        self.save_to_file(chain)  # save updated chain
-
-    def is_chain_valid(self, chain=None):
-        chain = chain or self.chain
-        for i in range(1, len(chain)):
+        with self.write_lock:
+            chain = self._load_cached()
+            if not self.check_integrity():
+                raise Exception("The blockchain is compromised! Block was not added.")
+
+            latest_block = chain[-1]
+            new_block = Block(len(chain), str(datetime.now()), new_data, latest_block.hash)
+            new_block.mine_block(self.difficulty, miner=self.miner, timeout=self.mining_timeout)
+            self._append(new_block)
+            return new_block
+
+    def add_records(self, records):
+        """Mine one block for a batch of records; its data is their Merkle root."""
+        with self.write_lock:
+            chain = self._load_cached()
+            if not self.check_integrity():
+                raise Exception("The blockchain is compromised! Block was not added.")
+
+            latest_block = chain[-1]
+            new_block = Block(len(chain), str(datetime.now()), merkle_root(records), latest_block.hash, records=list(records))
+            new_block.mine_block(self.difficulty, miner=self.miner, timeout=self.mining_timeout)
+            self._append(new_block)
+            return new_block
+
+    def get_block(self, index):
+        chain = self._load_cached()
+        if index is None or index < 0 or index >= len(chain):
+            return None
+        return chain[index]
+
+    def find_block(self, block_hash):
+        self.index.sync(self._load_cached())
+        locations = self.index.lookup(block_hash=block_hash)
+        return self.get_block(locations[0][0]) if locations else None
+
+    def find_record_proofs(self, filepath=None, filename=None, content_hash=None):
+        """Proofs for every record matching the given image keys, found through the chain index."""
+        self.index.sync(self._load_cached())
+        proofs = []
+        for block_index, record_index in self.index.lookup(filepath=filepath, filename=filename, content_hash=content_hash):
+            proof = self.get_record_proof(block_index, record_index)
+            if proof is not None:
+                proofs.append(proof)
+        return proofs
+
+    def get_record_proof(self, block_index, record_index):
+        """
+        Everything needed to check that one record is on the chain without the rest of it:
+        the record, its Merkle path to the block's root and the block header to re-hash.
+        """
+        block = self.get_block(block_index)
+        if block is None:
+            return None
+        header = {"index": block.index, "timestamp": block.timestamp, "previous_hash": block.previous_hash,
+                  "nonce": block.nonce, "hash": block.hash}
+        if block.records is None:
+            # single-record block from before batching: the record is the block data
+            return {"block": header, "record": block.data, "merkle_root": None, "proof": []}
+        if record_index is None or record_index < 0 or record_index >= len(block.records):
+            return None
+        return {"block": header, "record": block.records[record_index], "merkle_root": block.data,
+                "leaves": len(block.records), "proof": merkle_proof(block.records, record_index)}
+
+    def _append(self, block):
+        """Append one block to storage and write it through to the cache."""
+        before = self.storage.signature()
+        self.storage.append(self.block_to_dict(block))
+        if self._cached_chain is not None and before == self._cached_signature:
+            self._cached_chain.append(block)
+            self._cached_signature = self.storage.signature()
+        else:
+            # someone else changed the file meanwhile; re-read on next access
+            self.invalidate_cache()
+        self.index.sync(self._load_cached())
+
+    def is_chain_valid(self, chain=None, start=1):
+        chain = chain or self._load_cached()
+        for i in range(max(start, 1), len(chain)):
             current = chain[i]
             previous = chain[i - 1]
             if current.hash != current.calculate_hash() or current.previous_hash != previous.hash:
                 return False
+            if not current.has_valid_merkle_root():
+                return False
         return True
 
     def save_to_file(self, chain):
-        """Save the given chain to JSON."""
+        """Replace the stored chain with the given one."""
         data = [self.block_to_dict(block) for block in chain]
-        with open(self.storage_path, "w") as f:
-            json.dump(data, f, indent=4)
+        self.storage.write_all(data)
+        self.invalidate_cache()
 
     def load_from_file(self):
-        """Load the chain from JSON."""
-        with open(self.storage_path, "r") as f:
-            data = json.load(f)
-            return [self.block_from_dict(b) for b in data]
+        """Load the chain from storage."""
+        data = self.storage.load()
+        return [self.block_from_dict(b) for b in data]
+
+    def export_json(self, path):
+        """Write the chain in the legacy whole-file JSON format."""
+        JsonFileStorage(path).write_all(self.storage.load())
 
     def block_to_dict(self, block):
-        return {
+        d = {
             "index": block.index,
             "timestamp": block.timestamp,
             "data": block.data,
@@ -63,13 +183,116 @@ class Blockchain:
             "nonce": block.nonce,
             "hash": block.hash
         }
+        if block.records is not None:
+            d["records"] = block.records
+        return d
 
     def block_from_dict(self, data):
-        b = Block.from_full_data(data["index"], data["timestamp"], data["data"], data["previous_hash"], data["nonce"], data["hash"])
+        b = Block.from_full_data(data["index"], data["timestamp"], data["data"], data["previous_hash"], data["nonce"], data["hash"],
+                                 records=data.get("records"))
         return b
 
-    def check_integrity(self):
-        return self.is_chain_valid()
+    def check_integrity(self, full=False):
+        """
+        Verify the chain. Normally only blocks appended after the last checkpoint are
+        re-hashed, after confirming the checkpointed block is unchanged. A full audit
+        from genesis runs when requested or when there is no usable checkpoint; the
+        periodic one runs on the audit thread (ensure_audit_started).
+        """
+        chain = self._load_cached()
+        checkpoint = self.load_checkpoint()
+        now = time.time()
+
+        if full or checkpoint is None:
+            if not self.is_chain_valid(chain):
+                self.drop_checkpoint()
+                return False
+            self.save_checkpoint(len(chain) - 1, chain[-1].hash, now)
+            return True
+
+        height = checkpoint["height"]
+        if height >= len(chain):
+            return False  # chain is shorter than what was already verified
+        anchor = chain[height]
+        if anchor.hash != checkpoint["hash"] or anchor.hash != anchor.calculate_hash():
+            return False
+        if not self.is_chain_valid(chain, start=height + 1):
+            return False
+        if height != len(chain) - 1:
+            self.save_checkpoint(len(chain) - 1, chain[-1].hash, checkpoint["full_audit_at"])
+        return True
+
+    def ensure_audit_started(self):
+        """Start the thread that runs a full audit whenever the last one is older than audit_interval."""
+        if self._audit_thread is not None or self.audit_interval is None:
+            return
+        self._audit_thread = threading.Thread(target=self._audit_loop, name="chain-audit", daemon=True)
+        self._audit_thread.start()
+
+    def _audit_loop(self):
+        while True:
+            try:
+                self.run_audit_if_due()
+            except Exception as e:
+                print("Blockchain audit failed:", e)
+            time.sleep(min(self.audit_interval, 600))
+
+    def run_audit_if_due(self):
+        if not self._audit_lock.acquire(blocking=False):
+            return None  # another worker is auditing
+        try:
+            checkpoint = self.load_checkpoint()
+            if checkpoint is not None and time.time() - checkpoint["full_audit_at"] <= self.audit_interval:
+                return None
+            started = time.time()
+            valid = self.check_integrity(full=True)
+            self.audit_stats["audits"] += 1
+            self.audit_stats["last_audit_seconds"] = time.time() - started
+            self.audit_stats["last_result"] = valid
+            if not valid:
+                print("Blockchain audit found the chain compromised")
+            return valid
+        finally:
+            self._audit_lock.release()
+
+    def _sign_checkpoint(self, height, block_hash, full_audit_at):
+        if self.checkpoint_key is None:
+            return None
+        msg = f"{height}:{block_hash}:{full_audit_at}".encode()
+        return hmac.new(self.checkpoint_key, msg, hashlib.sha256).hexdigest()
+
+    def save_checkpoint(self, height, block_hash, full_audit_at):
+        data = {
+            "height": height,
+            "hash": block_hash,
+            "full_audit_at": full_audit_at,
+            "signature": self._sign_checkpoint(height, block_hash, full_audit_at)
+        }
+        tmp_path = f"{self.checkpoint_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def drop_checkpoint(self):
+        """After a failed full check: every worker's next check is a full one again, so all refuse new blocks."""
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    def load_checkpoint(self):
+        """Return the stored checkpoint, or None if it is missing, unreadable or its signature is wrong."""
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                data = json.load(f)
+            height, block_hash, full_audit_at = data["height"], data["hash"], data["full_audit_at"]
+        except Exception:
+            return None
+        expected = self._sign_checkpoint(height, block_hash, full_audit_at)
+        if expected is not None and not hmac.compare_digest(expected, data.get("signature") or ""):
+            print("Ignoring blockchain checkpoint with invalid signature")
+            return None
+        return data
 
     # def print_chain(self):
     #     for block in self.chain:
@@ -83,17 +306,19 @@ class Blockchain:
 
 
 class Block:
-    def __init__(self, index, timestamp, data, previous_hash=''):
+    def __init__(self, index, timestamp, data, previous_hash='', records=None):
         self._index = index
         self._timestamp = timestamp
         self._data = data
         self._previous_hash = previous_hash
+        self._records = records  # batch blocks: list of record strings, data holds their Merkle root
         self._nonce = 0
         self._hash = self.calculate_hash()
+        self.last_mining = None
     
     @classmethod
-    def from_full_data(cls, index, timestamp, data, previous_hash, nonce, hash):
-        block = cls(index, timestamp, data, previous_hash)
+    def from_full_data(cls, index, timestamp, data, previous_hash, nonce, hash, records=None):
+        block = cls(index, timestamp, data, previous_hash, records=records)
         block._nonce = nonce
         block._hash = hash
         return block
@@ -121,15 +346,41 @@ class Block:
     @property
     def hash(self):
         return self._hash
+
+    @property
+    def records(self):
+        return self._records
+
+    def has_valid_merkle_root(self):
+        return self._records is None or merkle_root(self._records) == self._data
     
 
+    def hash_prefix(self):
+        """Everything in the hashed string except the nonce, which always comes last."""
+        return f"{self._index}{self._timestamp}{self._data}{self._previous_hash}"
+
     def calculate_hash(self):
-        block_string = f"{self._index}{self._timestamp}{self._data}{self._previous_hash}{self._nonce}"
+        block_string = f"{self.hash_prefix()}{self._nonce}"
         return hashlib.sha256(block_string.encode()).hexdigest()
 
-    def mine_block(self, difficulty):
+    def mine_block(self, difficulty, miner=None, timeout=None, cancel_event=None):
         print(f"Mining block {self._index}...")
-        while self._hash[:difficulty] != '0' * difficulty:
-            self._nonce += 1
-            self._hash = self.calculate_hash()
-        print(f"Block mined: {self._hash}\n")
\ No newline at end of file
+        miner = miner or ProofOfWorkMiner(workers=1)
+        result = miner.mine(self.hash_prefix(), difficulty, timeout=timeout, cancel_event=cancel_event)
+        self._nonce = result.nonce
+        self._hash = result.hash
+        self.last_mining = result
+        print(f"Block mined: {self._hash} ({result.attempts} attempts, {result.hash_rate:.0f} H/s)\n")
+        return result
+
+
+def verify_record_proof(proof):
+    """Check a proof returned by Blockchain.get_record_proof (block PoW hash + Merkle path)."""
+    header = proof["block"]
+    data = proof["merkle_root"] if proof["merkle_root"] is not None else proof["record"]
+    block = Block.from_full_data(header["index"], header["timestamp"], data, header["previous_hash"], header["nonce"], header["hash"])
+    if block.calculate_hash() != header["hash"]:
+        return False
+    if proof["merkle_root"] is None:
+        return True
+    return verify_proof(proof["record"], proof["proof"], proof["merkle_root"], proof["leaves"])
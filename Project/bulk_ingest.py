@@ -0,0 +1,213 @@
+"""
+Server-side bulk import of an image directory or archive (.zip / .tar[.gz]).
+
+python bulk_ingest.py PATH --uploader NAME [--metadata JSON] [--batch 32] [--workers N]
+
+Images are decoded and featurized on a process pool, then YOLO and the text
+embedding run once per batch. Each batch is written to the database in one
+transaction and committed to the blockchain as one Merkle block. Finished
+sources are recorded in a journal file, so an interrupted import can simply
+be started again; files whose content is already stored are skipped.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from werkzeug.utils import secure_filename
+from content_store import sniff_image_type, HEAD_BYTES
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"}
+
+
+def scan_sources(path):
+    """(source id, display filename, reader) for every image file in a directory or archive."""
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                    full = os.path.join(root, name)
+                    yield full, name, (lambda full=full: open(full, "rb").read())
+    elif zipfile.is_zipfile(path):
+        zf = zipfile.ZipFile(path)
+        for info in zf.infolist():
+            if not info.is_dir() and os.path.splitext(info.filename)[1].lower() in IMAGE_EXTS:
+                yield f"{path}!{info.filename}", os.path.basename(info.filename), (lambda info=info: zf.read(info))
+    elif tarfile.is_tarfile(path):
+        tf = tarfile.open(path)
+        for member in tf.getmembers():
+            if member.isfile() and os.path.splitext(member.name)[1].lower() in IMAGE_EXTS:
+                yield f"{path}!{member.name}", os.path.basename(member.name), (lambda m=member: tf.extractfile(m).read())
+    else:
+        raise Exception(f"{path} is not a directory or a zip/tar archive")
+
+
+def prepare_image(data):
+    """Worker process: hash and decode one image, compute its colour feature vector."""
+    from ml_image_analyzer import ImageAnalyzer
+    content_hash = hashlib.sha256(data).hexdigest()
+    try:
+        pil = Image.open(io.BytesIO(data)).convert("RGB")
+    except Exception as e:
+        return content_hash, None, str(e)
+    return content_hash, ImageAnalyzer.image_to_feature(pil), None
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds = {}
+        self.items = {}
+
+    def add(self, stage, seconds, items):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    def report(self, total_seconds, total_images):
+        print(f"\n{'stage':<12} {'images':>8} {'seconds':>9} {'images/s':>10}")
+        for stage, secs in self.seconds.items():
+            n = self.items[stage]
+            print(f"{stage:<12} {n:>8} {secs:>9.2f} {(n / secs if secs > 0 else 0):>10.1f}")
+        rate = total_images / total_seconds if total_seconds > 0 else 0
+        print(f"{'total':<12} {total_images:>8} {total_seconds:>9.2f} {rate:>10.1f}")
+
+
+def load_journal(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["source"])
+                except Exception:
+                    continue
+    return done
+
+
+def ingest(path, uploader, metadata="{}", batch_size=32, workers=None, journal_path="ingest_journal.jsonl"):
+    # the server module owns the app, models, stores and blockchain
+    from server import (app, db, analyzer, blockchain, vector_index, content_store, image_features, search_index)
+    from models import ImageEntry, image_entry_to_dict
+    from semantic_search import embed_texts, text_from_image_entry
+    import numpy as np
+
+    done = load_journal(journal_path)
+    sources = [s for s in scan_sources(path) if s[0] not in done]
+    print(f"{len(sources)} images to import ({len(done)} already done according to {journal_path})")
+    timer = StageTimer()
+    started = time.time()
+    imported = skipped = failed = 0
+
+    with app.app_context(), ProcessPoolExecutor(max_workers=workers) as pool, open(journal_path, "a") as journal:
+        for start in range(0, len(sources), batch_size):
+            batch = sources[start:start + batch_size]
+
+            t = time.time()
+            datas = [read() for _, _, read in batch]
+            timer.add("read", time.time() - t, len(batch))
+
+            t = time.time()
+            prepared = list(pool.map(prepare_image, datas))
+            timer.add("decode", time.time() - t, len(batch))
+
+            known = {h for (h,) in db.session.query(ImageEntry.content_hash)
+                     .filter(ImageEntry.content_hash.in_([p[0] for p in prepared])).all()}
+            items = []
+            for (source, name, _), data, (content_hash, feat, error) in zip(batch, datas, prepared):
+                if error is not None:
+                    print(f"Skipping {source}: cannot decode ({error})")
+                    failed += 1
+                    journal.write(json.dumps({"source": source, "error": error}) + "\n")
+                    continue
+                # stored under the sniffed type like /upload, so the same bytes always get the same path
+                ext = sniff_image_type(data[:HEAD_BYTES])
+                if ext is None:
+                    print(f"Skipping {source}: not a recognised image type")
+                    failed += 1
+                    journal.write(json.dumps({"source": source, "error": "unrecognised image type"}) + "\n")
+                    continue
+                if content_hash in known:
+                    skipped += 1
+                    journal.write(json.dumps({"source": source, "duplicate": content_hash}) + "\n")
+                    continue
+                known.add(content_hash)
+                filename = secure_filename(name)
+                _, filepath, _, _ = content_store.save_bytes(data, ext)
+                items.append({"source": source, "filename": filename, "filepath": filepath,
+                              "content_hash": content_hash, "feat": feat})
+            if not items:
+                journal.flush()
+                continue
+
+            t = time.time()
+            objects = analyzer.detect_objects_batch([it["filepath"] for it in items])
+            timer.add("detect", time.time() - t, len(items))
+
+            entries = []
+            version = analyzer.model_version
+            for it, objs in zip(items, objects):
+                analysis = analyzer.analysis_from_feature(it["feat"], objs)
+                cluster = analysis.get("cluster")
+                entries.append(ImageEntry(filename=it["filename"], uploader=uploader, filepath=it["filepath"],
+                                          content_hash=it["content_hash"], cluster=cluster,
+                                          cluster_version=version if cluster is not None else None,
+                                          metadata_json=metadata, analysis_json=json.dumps(analysis),
+                                          objects_json=json.dumps(objs), chain_status="pending"))
+
+            t = time.time()
+            embeddings = embed_texts([text_from_image_entry(ie) for ie in entries])
+            timer.add("embed", time.time() - t, len(entries))
+
+            # one transaction per batch; rows stay "pending" until the block is mined, so if the
+            # import dies before that, the server's commit queue puts them on the chain
+            t = time.time()
+            for ie, emb in zip(entries, embeddings):
+                ie.embedding_sha256 = hashlib.sha256(np.asarray(emb, dtype=np.float32).tobytes()).hexdigest()
+                db.session.add(ie)
+            db.session.flush()
+            for ie in entries:
+                search_index.add(ie)
+            db.session.commit()
+            for it, ie, emb in zip(items, entries, embeddings):
+                vector_index.add(ie.id, emb)
+                image_features.put(ie.id, it["feat"])
+            for it, ie in zip(items, entries):
+                journal.write(json.dumps({"source": it["source"], "image_id": ie.id}) + "\n")
+            journal.flush()
+            imported += len(entries)
+            timer.add("database", time.time() - t, len(entries))
+
+            t = time.time()
+            with blockchain.write_lock:
+                # a server started meanwhile may have put pending rows on the chain already
+                db.session.expire_all()
+                entries = [ie for ie in entries if ie.chain_status == "pending"]
+                if entries:
+                    block = blockchain.add_records([json.dumps(image_entry_to_dict(ie)) for ie in entries])
+                    for pos, ie in enumerate(entries):
+                        ie.block_index, ie.block_hash, ie.block_record = block.index, block.hash, pos
+                        ie.chain_status = "committed"
+                    db.session.commit()
+            timer.add("blockchain", time.time() - t, len(entries))
+
+            print(f"{start + len(batch)}/{len(sources)} processed, {imported} imported")
+
+    timer.report(time.time() - started, imported)
+    print(f"imported {imported}, duplicates skipped {skipped}, failed {failed}")
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import images into the server")
+    parser.add_argument("path", help="directory, .zip or .tar archive")
+    parser.add_argument("--uploader", required=True)
+    parser.add_argument("--metadata", default="{}", help="metadata JSON stored on every image")
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="decode processes (default: all cores)")
+    parser.add_argument("--journal", default="ingest_journal.jsonl")
+    args = parser.parse_args()
+    ingest(args.path, args.uploader, args.metadata, args.batch, args.workers, args.journal)
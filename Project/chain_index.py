@@ -0,0 +1,119 @@
+import json
+import os
+from file_lock import FileLock
+
+
+class ChainIndex:
+    """
+    Secondary index over the blockchain, kept in an append-only file next to it.
+    Maps block hash -> block index and image filepath / filename / content hash
+    -> (block index, record position), so lookups are dict hits instead of a
+    scan over every block. Maintained on append; sync() catches up with blocks
+    it has not seen (written by another process, or an index file that is missing).
+    Writers in several processes take `<path>.lock` and first read what the others appended.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file_lock = FileLock(path + ".lock")
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.block_hashes = []  # block index -> hash, for the blocks indexed so far
+        self.by_hash = {}
+        self.by_filepath = {}
+        self.by_filename = {}
+        self.by_content_hash = {}
+        self._offset = 0  # bytes of the index file applied so far
+
+    def _load(self):
+        """Apply entries appended to the file since the last call."""
+        if not os.path.exists(self.path):
+            return
+        if os.path.getsize(self.path) < self._offset:
+            self._reset()  # rebuilt by another process
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._apply(json.loads(line))
+                self._offset += len(line)
+
+    @property
+    def height(self):
+        return len(self.block_hashes)
+
+    def _apply(self, entry):
+        index, block_hash = entry["block"], entry["hash"]
+        if index != len(self.block_hashes):
+            raise Exception(f"Chain index out of order at block {index}")
+        self.block_hashes.append(block_hash)
+        self.by_hash[block_hash] = index
+        for rec in entry["records"]:
+            loc = (index, rec["pos"])
+            for key, table in (("filepath", self.by_filepath), ("filename", self.by_filename),
+                               ("content_hash", self.by_content_hash)):
+                if rec.get(key):
+                    table.setdefault(rec[key], []).append(loc)
+
+    @staticmethod
+    def _entry_for(block):
+        records = block.records if block.records is not None else [block.data]
+        keys = []
+        for pos, rec in enumerate(records):
+            try:
+                d = json.loads(rec)
+            except Exception:
+                continue  # e.g. the genesis block
+            if not isinstance(d, dict):
+                continue
+            keys.append({"pos": pos if block.records is not None else None, "filepath": d.get("filepath"),
+                         "filename": d.get("filename"), "content_hash": d.get("content_hash")})
+        return {"block": block.index, "hash": block.hash, "records": keys}
+
+    def add_blocks(self, blocks):
+        with self._file_lock:
+            self._load()
+            blocks = [b for b in blocks if b.index >= self.height]  # another process may have added them
+            lines = [json.dumps(self._entry_for(b), separators=(",", ":")) + "\n" for b in blocks]
+            with open(self.path, "a") as f:
+                f.writelines(lines)
+            for line in lines:
+                self._apply(json.loads(line))
+                self._offset += len(line.encode())
+
+    def sync(self, chain):
+        """Bring the index up to date with `chain`; rebuild if the chain was rewritten under it."""
+        n = self.height
+        if n < len(chain):
+            with self._file_lock:
+                self._load()
+                n = self.height
+        # an index ahead of `chain` is fine when they agree: another process appended after `chain` was read
+        m = min(n, len(chain))
+        if m > 0 and chain[m - 1].hash != self.block_hashes[m - 1]:
+            self.rebuild(chain)
+            return
+        if n < len(chain):
+            self.add_blocks(chain[n:])
+
+    def rebuild(self, chain):
+        with self._file_lock:
+            self._reset()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.add_blocks(chain)
+
+    def lookup(self, block_hash=None, filepath=None, filename=None, content_hash=None):
+        """Locations (block index, record position) matching any of the given keys."""
+        found = []
+        if block_hash and block_hash in self.by_hash:
+            found.append((self.by_hash[block_hash], None))
+        for value, table in ((filepath, self.by_filepath), (filename, self.by_filename),
+                             (content_hash, self.by_content_hash)):
+            if value:
+                found.extend(table.get(value, []))
+        seen = set()
+        return [loc for loc in found if not (loc in seen or seen.add(loc))]
@@ -0,0 +1,139 @@
+import json
+import os
+import sys
+
+
+class JsonFileStorage:
+    """Whole-chain JSON file (the original format). Every write rewrites the file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def signature(self):
+        return file_signature(self.path)
+
+    def load(self):
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def write_all(self, records):
+        with open(self.path, "w") as f:
+            json.dump(records, f, indent=4)
+
+    def append(self, record):
+        records = self.load() if self.exists() else []
+        records.append(record)
+        self.write_all(records)
+
+
+class SegmentLogStorage:
+    """
+    Append-only log: one compact JSON record per line.
+    Appending a block writes and fsyncs a single line, so the cost does not
+    depend on the length of the chain. A torn last line (crash mid-write)
+    is ignored on load and cut off before the next append.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def exists(self):
+        return os.path.exists(self.path) and os.path.getsize(self.path) > 0
+
+    def signature(self):
+        return file_signature(self.path)
+
+    def load(self):
+        records = []
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # incomplete tail record
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+        return records
+
+    def write_all(self, records):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for record in records:
+                f.write(self._encode(record))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def append(self, record):
+        with open(self.path, "ab") as f:
+            self._truncate_torn_tail(f)
+            f.write(self._encode(record))
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+    @staticmethod
+    def _truncate_torn_tail(f):
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        with open(f.name, "rb") as r:
+            r.seek(size - 1)
+            if r.read(1) == b"\n":
+                return
+            # walk back to the end of the last complete record
+            pos = size
+            while pos > 0:
+                step = min(4096, pos)
+                pos -= step
+                r.seek(pos)
+                chunk = r.read(step)
+                nl = chunk.rfind(b"\n")
+                if nl != -1:
+                    pos += nl + 1
+                    break
+        f.truncate(pos)
+
+
+def file_signature(path):
+    """(inode, size, mtime) of a file; changes whenever the file is rewritten or appended to."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def open_storage(path):
+    """Pick a backend from the file extension: .json keeps the legacy format."""
+    if path.endswith(".json"):
+        return JsonFileStorage(path)
+    return SegmentLogStorage(path)
+
+
+def migrate(src_path, dst_path):
+    """Copy all blocks from one storage file to another (e.g. blockchain.json -> blockchain.log)."""
+    src = open_storage(src_path)
+    dst = open_storage(dst_path)
+    if not src.exists():
+        raise Exception(f"Source chain {src_path} does not exist")
+    if dst.exists():
+        raise Exception(f"Destination {dst_path} already exists, refusing to overwrite")
+    records = src.load()
+    dst.write_all(records)
+    return len(records)
+
+
+if __name__ == "__main__":
+    # python chain_storage.py blockchain.json blockchain.log   (import legacy JSON)
+    # python chain_storage.py blockchain.log export.json       (export to JSON)
+    if len(sys.argv) != 3:
+        print("usage: python chain_storage.py <source> <destination>")
+        sys.exit(1)
+    n = migrate(sys.argv[1], sys.argv[2])
+    print(f"Migrated {n} blocks: {sys.argv[1]} -> {sys.argv[2]}")
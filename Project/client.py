@@ -3,6 +3,7 @@ import os
 from getpass import getpass
 from PIL import Image
 import shutil
+import time
 
 SERVER = "http://127.0.0.1:5000"
 DOWNLOAD_FOLDER = "client_downloads"
@@ -24,16 +25,31 @@ def api_post(path, json_data=None, files=None, headers=None, data=None):
     except:
         return r.status_code, {"raw": r.text}
 
-def api_get(path, params=None):
+def api_get(path, params=None, with_headers=False):
     url = SERVER + path
     hd = {}
     if token:
         hd["X-Token"] = token
     r = requests.get(url, params=params, headers=hd)
     try:
-        return r.status_code, r.json()
+        res = r.status_code, r.json()
     except:
-        return r.status_code, {"raw": r.text}
+        res = r.status_code, {"raw": r.text}
+    return res + (r.headers,) if with_headers else res
+
+def iter_images(page_size=50):
+    """All images, newest first, fetched a page at a time as the caller iterates."""
+    params = {"limit": page_size}
+    while True:
+        sc, res, headers = api_get("/images", params=params, with_headers=True)
+        if sc != 200:
+            raise Exception(f"listing failed: {sc} {res}")
+        for it in res:
+            yield it
+        cursor = headers.get("X-Next-Cursor")
+        if not cursor:
+            return
+        params = {"limit": page_size, "cursor": cursor}
 
 def register():
     global username
@@ -76,11 +92,36 @@ def upload():
     data = {"metadata": metadata}
     sc, res = api_post("/upload", files=files, data=data)
     print(sc, res)
+    if sc in (200, 202) and "image_id" in res:
+        wait_for_commit(res["image_id"])
 
-def list_images():
+def wait_for_commit(image_id, timeout=60, interval=1.0):
+    """Poll until the upload has been written to the blockchain."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        sc, res = api_get(f"/image/{image_id}/status")
+        if sc != 200:
+            print("Status check failed:", res)
+            return None
+        if res.get("chain_status") != "pending":
+            print(f"Blockchain: {res['chain_status']} (block {res.get('block_index')}, {res.get('block_hash')})")
+            return res
+        time.sleep(interval)
+    print("Still pending on the blockchain; check again later.")
+    return None
+
+def list_images(page_size=20):
     q = input("search query (press enter for all): ").strip()
-    params = {"q": q} if q else {}
-    sc, res = api_get("/images", params=params)
+    if not q:
+        try:
+            for n, it in enumerate(iter_images(page_size), 1):
+                print(f"{it['id']}: {it['filename']} (uploader: {it['uploader']}, {it['upload_time']})")
+                if n % page_size == 0 and input("enter for more, q to stop: ").strip().lower() == "q":
+                    break
+        except Exception as e:
+            print("Error:", e)
+        return
+    sc, res = api_get("/images", params={"q": q})
     if sc == 200:
         for it in res:
             print(f"{it['id']}: {it['filename']} (uploader: {it['uploader']}, {it['upload_time']})")
@@ -0,0 +1,177 @@
+"""
+Training of the image clustering model (MiniBatchKMeans over the 28-dim colour/histogram
+features), outside of any request handler.
+
+The features are written to the feature store once per image at upload / import;
+the jobs read them from there, so they never reopen the stored images (except once
+for images uploaded before the store existed).
+
+ClusterMaintainer runs inside the server: it trains the first model once there are
+enough images, then updates it with partial_fit as new features arrive. Every model
+change bumps the model version, and images whose cluster_version is older are
+re-labelled in small batches. With several server workers only the one holding
+cluster_model.lock trains; the others reload the saved model when it changes.
+
+python cluster_job.py                 full retrain now (running servers reload the model)
+TBCH_RETRAIN_INTERVAL=3600            the server also does a full retrain every hour
+"""
+import threading
+import time
+import numpy as np
+from PIL import Image
+from file_lock import FileLock
+
+FEATURE_DIM = 28
+
+
+def backfill_features(analyzer, feature_store, ImageEntry):
+    """Compute features for images stored before the feature store existed."""
+    added = 0
+    for image_id, filepath in ImageEntry.query.with_entities(ImageEntry.id, ImageEntry.filepath).all():
+        if image_id in feature_store:
+            continue
+        try:
+            feature_store.put(image_id, analyzer.image_to_feature(Image.open(filepath)))
+            added += 1
+        except Exception as e:
+            print(f"Couldn't compute features of image {image_id}: {e}")
+    return added
+
+
+def retrain_clusters(analyzer, feature_store):
+    """Fit the clustering model on every stored feature vector; False when there are too few images."""
+    if len(feature_store) < analyzer.n_clusters:
+        return False
+    started = time.time()
+    analyzer.fit(np.asarray(feature_store.matrix(), dtype=np.float64))
+    print(f"Clustering model retrained on {len(feature_store)} images in {time.time() - started:.1f}s")
+    return True
+
+
+class ClusterMaintainer:
+    def __init__(self, app, analyzer, feature_store, interval=30, min_new=32, relabel_batch=500,
+                 retrain_interval=0, lock_path="cluster_model.lock"):
+        self.app = app
+        self.analyzer = analyzer
+        self.feature_store = feature_store
+        self.interval = interval  # seconds between rounds
+        self.min_new = min_new  # new images needed before the model is updated
+        self.relabel_batch = relabel_batch
+        # relabel pass: model version it labels with, and the last image id it has checked
+        self._relabel_version = None
+        self._relabel_after = 0
+        self.retrain_interval = retrain_interval  # seconds between full retrains, 0 = never
+        self._last_retrain = time.time()
+        self._leader_lock = FileLock(lock_path)  # held for the life of the process that trains
+        self.leader = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"model_updates": 0, "relabel_checked": 0, "relabelled": 0, "last_round_seconds": 0.0}
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="cluster-maintainer", daemon=True)
+            self._thread.start()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["model_version"] = self.analyzer.model_version
+        stats["samples_seen"] = self.analyzer.samples_seen
+        stats["leader"] = self.leader
+        return stats
+
+    def _run(self):
+        while True:
+            started = time.time()
+            try:
+                self.run_once()
+            except Exception as e:
+                print("Cluster maintenance failed:", e)
+            self.stats["last_round_seconds"] = time.time() - started
+            time.sleep(self.interval)
+
+    def run_once(self):
+        # pick up a model saved by cluster_job.py or by the training worker
+        self.analyzer.reload_if_changed()
+        if not self.leader:
+            self.leader = self._leader_lock.acquire(blocking=False)
+            if not self.leader:
+                return 0
+        if self.retrain_interval and time.time() - self._last_retrain >= self.retrain_interval:
+            self._last_retrain = time.time()
+            if retrain_clusters(self.analyzer, self.feature_store):
+                self.stats["model_updates"] += 1
+        else:
+            self.update_model()
+        with self.app.app_context():
+            return self.relabel()
+
+    def update_model(self):
+        """Train or incrementally update the model from feature-store rows it has not seen; True if it changed."""
+        n = len(self.feature_store)
+        if self.analyzer.kmeans is None or not self.analyzer.incremental:
+            if n < max(self.analyzer.n_clusters, self.min_new):
+                return False
+            self.analyzer.fit(np.asarray(self.feature_store.matrix(), dtype=np.float64))
+        else:
+            seen = min(self.analyzer.samples_seen, n)
+            if n - seen < self.min_new:
+                return False
+            self.analyzer.partial_fit(np.asarray(self.feature_store.matrix()[seen:n], dtype=np.float64))
+        self.stats["model_updates"] += 1
+        return True
+
+    def relabel(self):
+        """
+        Bring labels up to the current model, a batch per transaction; returns the number of rows written.
+        Each model version gets one pass over the images in id order that predicts every label
+        but writes only the rows whose label changed, so an incremental update costs O(changed)
+        writes, not a rewrite of the catalogue. The pass then continues with newly uploaded ids.
+        """
+        from models import db, ImageEntry
+        version = self.analyzer.model_version
+        if version != self._relabel_version:
+            self._relabel_version, self._relabel_after = version, 0
+        done = 0
+        while self.analyzer.kmeans is not None:
+            batch = (db.session.query(ImageEntry.id, ImageEntry.cluster, ImageEntry.cluster_version)
+                     .filter(ImageEntry.id > self._relabel_after)
+                     .order_by(ImageEntry.id).limit(self.relabel_batch).all())
+            if not batch:
+                break
+            ids = [r[0] for r in batch]
+            rows = self.feature_store.rows_for(ids)
+            have = rows >= 0
+            updates = []
+            if have.any():
+                feats = np.asarray(self.feature_store.matrix()[rows[have]], dtype=np.float64)
+                labels, labelled_version = self.analyzer.predict_many(feats)
+                if labelled_version != version:
+                    break  # the model changed meanwhile; the next round starts a pass for the new version
+                # rows without stored features keep their label (cluster_job.py backfills features)
+                for (image_id, cluster, _), label in zip([r for r, ok in zip(batch, have) if ok], labels):
+                    if cluster != int(label):
+                        updates.append({"id": image_id, "cluster": int(label), "cluster_version": version})
+            if updates:
+                db.session.bulk_update_mappings(ImageEntry, updates)
+                db.session.commit()
+            self._relabel_after = ids[-1]
+            done += len(updates)
+            self.stats["relabel_checked"] += len(ids)
+            self.stats["relabelled"] += len(updates)
+            time.sleep(0)  # let request threads run between batches
+        return done
+
+if __name__ == "__main__":
+    from server import app, analyzer, image_features
+    from models import ImageEntry
+    with app.app_context():
+        added = backfill_features(analyzer, image_features, ImageEntry)
+        if added:
+            print(f"Computed features for {added} older images")
+    if not retrain_clusters(analyzer, image_features):
+        print(f"Not enough images to train {analyzer.n_clusters} clusters")
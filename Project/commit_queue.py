@@ -0,0 +1,144 @@
+import json
+import queue
+import threading
+import time
+from models import db, ImageEntry, image_entry_to_dict
+
+
+class BlockCommitQueue:
+    """
+    Background writer that puts uploaded images on the blockchain.
+    /upload stores the ImageEntry as "pending" and submits its id; a worker thread
+    collects ids into batches and mines one block per batch (records + Merkle root),
+    then records the block index, hash and record position on each entry ("committed").
+    A batch that fails (e.g. mining timed out, database busy) stays "pending" and is
+    retried with growing delays; after max_attempts its entries are marked "failed".
+    Failed entries are queued again on the next start, or by requeue_failed().
+    """
+
+    def __init__(self, app, blockchain, batch_size=16, max_wait=1.0, max_attempts=5, retry_delay=5.0):
+        self.app = app
+        self.blockchain = blockchain
+        self.batch_size = batch_size
+        self.max_wait = max_wait  # seconds to wait for more entries before committing a batch
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay  # seconds before the first retry, doubled for each further one
+        self._queue = queue.Queue()
+        self._attempts = {}  # image id -> failed attempts so far
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "committed": 0, "retried": 0, "failed": 0, "batches": 0,
+                      "last_batch_seconds": 0.0}
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._recover_pending()
+            self._thread = threading.Thread(target=self._run, name="block-commit", daemon=True)
+            self._thread.start()
+
+    def _recover_pending(self):
+        # entries accepted before a restart but never mined, and ones that gave up before it
+        self.requeue_failed()
+        with self.app.app_context():
+            rows = db.session.query(ImageEntry.id).filter_by(chain_status="pending").order_by(ImageEntry.id).all()
+        for (image_id,) in rows:
+            self._queue.put(image_id)
+
+    def requeue_failed(self):
+        """Put entries marked "failed" back in the queue; returns how many."""
+        with self.app.app_context():
+            ids = [i for (i,) in db.session.query(ImageEntry.id).filter_by(chain_status="failed").all()]
+            if ids:
+                ImageEntry.query.filter(ImageEntry.id.in_(ids)).update({"chain_status": "pending"},
+                                                                        synchronize_session=False)
+                db.session.commit()
+        if self._thread is not None:
+            for image_id in ids:
+                self._queue.put(image_id)
+        return len(ids)
+
+    def submit(self, image_id):
+        self.ensure_started()
+        self.stats["submitted"] += 1
+        self._queue.put(image_id)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.time()
+            try:
+                # under the chain lock the pending check is final: another worker that recovered
+                # the same rows after a restart finds them committed and skips them
+                with self.blockchain.write_lock, self.app.app_context():
+                    self._commit_batch(batch)
+            except Exception as e:
+                print("Block commit batch failed:", e)
+                self._retry(batch)
+            self.stats["batches"] += 1
+            self.stats["last_batch_seconds"] = time.time() - started
+
+    def _commit_batch(self, ids):
+        entries = ImageEntry.query.filter(ImageEntry.id.in_(ids)).order_by(ImageEntry.id).all()
+        entries = [ie for ie in entries if ie.chain_status == "pending"]
+        if not entries:
+            return
+        block = self.blockchain.add_records([json.dumps(image_entry_to_dict(ie)) for ie in entries])
+        for pos, ie in enumerate(entries):
+            ie.block_index = block.index
+            ie.block_hash = block.hash
+            ie.block_record = pos
+            ie.chain_status = "committed"
+        self.stats["committed"] += len(entries)
+        db.session.commit()
+        for ie in entries:
+            self._attempts.pop(ie.id, None)
+
+    def _retry(self, ids):
+        """Queue a failed batch again after a delay, or mark entries "failed" once out of attempts."""
+        again, gave_up = [], []
+        for image_id in ids:
+            n = self._attempts.get(image_id, 0) + 1
+            if n >= self.max_attempts:
+                self._attempts.pop(image_id, None)
+                gave_up.append(image_id)
+            else:
+                self._attempts[image_id] = n
+                again.append(image_id)
+        if again:
+            delay = self.retry_delay * 2 ** (max(self._attempts[i] for i in again) - 1)
+            timer = threading.Timer(delay, lambda: [self._queue.put(i) for i in again])
+            timer.daemon = True
+            timer.start()
+            self.stats["retried"] += len(again)
+        if gave_up:
+            print(f"Giving up on committing {len(gave_up)} images to the blockchain after {self.max_attempts} attempts")
+            try:
+                with self.app.app_context():
+                    ImageEntry.query.filter(ImageEntry.id.in_(gave_up), ImageEntry.chain_status == "pending") \
+                        .update({"chain_status": "failed"}, synchronize_session=False)
+                    db.session.commit()
+                self.stats["failed"] += len(gave_up)
+            except Exception as e:
+                print("Could not mark images as failed, they stay pending:", e)
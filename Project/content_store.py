@@ -0,0 +1,90 @@
+import hashlib
+import os
+import tempfile
+
+HEAD_BYTES = 16
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def sniff_image_type(head):
+    """File extension for the image format recognised from the first bytes of a file, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head.startswith(b"BM"):
+        return ".bmp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+class ContentStore:
+    """
+    Content-addressed file storage: a file is stored once under its SHA-256, in
+    fanned-out directories (root/ab/cd/abcd....png) so no directory grows too large.
+    The hash is computed while the upload is streamed to disk.
+    """
+
+    def __init__(self, root="storage/objects", fanout=2):
+        self.root = root
+        self.fanout = fanout  # directory levels, two hex characters each
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, content_hash, ext=""):
+        parts = [content_hash[2 * i:2 * i + 2] for i in range(self.fanout)]
+        return os.path.join(self.root, *parts, content_hash + ext.lower())
+
+    def save_stream(self, stream, ext="", chunk_size=1 << 16, max_bytes=None, head=b""):
+        """
+        Copy a file-like object into the store; `head` is data already read from the stream.
+        Raises UploadTooLarge (and keeps nothing) once more than max_bytes arrive.
+        Returns (content_hash, path, size, is_new); is_new is False when identical bytes were already stored.
+        """
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                chunk = head or stream.read(chunk_size)
+                while chunk:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLarge(f"file is larger than {max_bytes} bytes")
+                    h.update(chunk)
+                    out.write(chunk)
+                    chunk = stream.read(chunk_size)
+            content_hash = h.hexdigest()
+            path = self.path_for(content_hash, ext)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                return content_hash, path, size, False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            return content_hash, path, size, True
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def save_bytes(self, data, ext=""):
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(content_hash, ext)
+        if os.path.exists(path):
+            return content_hash, path, len(data), False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+        return content_hash, path, len(data), True
+
+    def delete(self, path):
+        if os.path.exists(path):
+            os.remove(path)
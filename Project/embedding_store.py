@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import numpy as np
+from file_lock import FileLock
+
+
+class EmbeddingStore:
+    """
+    Fixed-size float32 vectors in one contiguous binary file, memory-mapped for reads.
+    Row keys (image ids, usernames, ...) are appended as JSON lines to `<path>.keys`,
+    giving a key -> row map. matrix() is a zero-copy (rows, dim) view, so callers can
+    score everything with a single matmul instead of parsing JSON per row.
+    Several processes may share the files: writes hold `<path>.lock`, and readers pick
+    up rows appended by other processes from the keys file.
+    """
+
+    def __init__(self, path, dim=384):
+        self.path = path
+        self.keys_path = path + ".keys"
+        self.dim = dim
+        self._row_bytes = dim * 4
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(path + ".lock")
+        self._keys = []
+        self._row_of = {}
+        self._keys_offset = 0  # bytes of the keys file read so far
+        self._mm = None
+        with self._file_lock:
+            self._load()
+
+    def _load(self):
+        # called with the file lock held, so a partial line is a torn write and not one in progress
+        keys = []
+        valid = 0
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    keys.append(json.loads(line))
+                    valid += len(line)
+            if valid != os.path.getsize(self.keys_path):
+                with open(self.keys_path, "r+b") as f:
+                    f.truncate(valid)
+        rows = os.path.getsize(self.path) // self._row_bytes if os.path.exists(self.path) else 0
+        # a crash between writing a vector and its key leaves the two files out of step
+        n = min(len(keys), rows)
+        if len(keys) > n:
+            with open(self.keys_path, "w") as f:
+                f.writelines(json.dumps(k) + "\n" for k in keys[:n])
+            valid = os.path.getsize(self.keys_path)
+        self._keys = keys[:n]
+        self._row_of = {k: r for r, k in enumerate(self._keys)}
+        self._keys_offset = valid
+        self._mm = None
+
+    def _catch_up(self):
+        """Read keys appended by other processes since the last look."""
+        try:
+            size = os.path.getsize(self.keys_path)
+        except OSError:
+            return
+        if size == self._keys_offset:
+            return
+        if size < self._keys_offset:
+            with self._file_lock, self._lock:
+                self._load()  # rewritten by a repair
+            return
+        with self._lock:
+            self._read_new_keys()
+
+    def _read_new_keys(self):
+        if not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # still being written
+                key = json.loads(line)
+                self._row_of[key] = len(self._keys)
+                self._keys.append(key)
+                self._keys_offset += len(line)
+
+    def __len__(self):
+        self._catch_up()
+        return len(self._keys)
+
+    def __contains__(self, key):
+        self._catch_up()
+        return key in self._row_of
+
+    def keys(self):
+        self._catch_up()
+        return list(self._keys)
+
+    def row_of(self, key):
+        self._catch_up()
+        return self._row_of.get(key)
+
+    def key_at(self, row):
+        return self._keys[row]
+
+    def matrix(self):
+        """Read-only (len, dim) view of all vectors."""
+        self._catch_up()
+        n = len(self._keys)
+        if n == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        mm = self._mm
+        if mm is None or mm.shape[0] != n:
+            mm = np.memmap(self.path, dtype=np.float32, mode="r", shape=(n, self.dim))
+            self._mm = mm
+        return mm
+
+    def get(self, key):
+        row = self.row_of(key)
+        if row is None:
+            return None
+        return self.matrix()[row]
+
+    def rows_for(self, keys):
+        """Row index for each key, -1 where the key has no vector."""
+        self._catch_up()
+        return np.array([self._row_of.get(k, -1) for k in keys], dtype=np.int64)
+
+    def put(self, key, vector):
+        vec = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        with self._file_lock, self._lock:
+            self._read_new_keys()
+            row = self._row_of.get(key)
+            if row is not None:
+                with open(self.path, "r+b") as f:
+                    f.seek(row * self._row_bytes)
+                    f.write(vec.tobytes())
+                return row
+            with open(self.path, "ab") as f:
+                # drop a partial row left by an interrupted write
+                f.truncate(len(self._keys) * self._row_bytes)
+                f.write(vec.tobytes())
+            line = json.dumps(key) + "\n"
+            with open(self.keys_path, "a") as f:
+                f.write(line)
+            row = len(self._keys)
+            self._keys.append(key)
+            self._row_of[key] = row
+            self._keys_offset += len(line.encode())
+            return row
@@ -0,0 +1,16 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+bind = os.environ.get("TBCH_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("TBCH_WORKERS", "4"))
+threads = int(os.environ.get("TBCH_THREADS", "4"))
+# import the app (and load the models) once in the master before forking the workers
+preload_app = True
+timeout = 180  # the first upload in a worker may wait for a model to load
+
+
+def post_fork(server, worker):
+    # database connections opened in the master during startup must not be shared by workers
+    from server import app, db
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,268 @@
+"""
+Local inference service that owns the YOLO and MiniLM models.
+
+Web workers send detection / embedding requests over a Unix socket (or TCP on
+systems without one); the service groups concurrent requests into micro-batches
+(up to max_batch items, or whatever arrived within max_wait_ms) so the models run
+once per batch instead of once per request.
+
+python inference_service.py [address]      default: $TBCH_INFERENCE_ADDRESS or /tmp/tbch-inference.sock
+Then start the server with TBCH_INFERENCE_ADDRESS set to the same address.
+
+Messages are pickled, so only clients holding the key may connect: $TBCH_INFERENCE_KEY,
+or else the key the service generates into inference.key (mode 0600,
+$TBCH_INFERENCE_KEY_FILE to move it), which the server reads from the same place.
+"""
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Listener, Client
+
+DEFAULT_ADDRESS = "/tmp/tbch-inference.sock"
+DEFAULT_KEY_FILE = "inference.key"
+
+
+def parse_address(address):
+    """'host:port' -> TCP address tuple, anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def _authkey(create=False):
+    """The shared key; with create (the service) a random one is written to the key file if there is none."""
+    key = os.environ.get("TBCH_INFERENCE_KEY")
+    if key:
+        return key.encode()
+    path = os.environ.get("TBCH_INFERENCE_KEY_FILE", DEFAULT_KEY_FILE)
+    if create and not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    if not os.path.exists(path):
+        raise RuntimeError(f"No inference service key: set TBCH_INFERENCE_KEY or start the service to create {path}")
+    if os.name == "posix" and os.stat(path).st_mode & 0o077:
+        raise RuntimeError(f"{path} must not be readable by other users (chmod 600 {path})")
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+class MicroBatcher:
+    """Collects submitted items and calls `run_batch(items) -> results` on groups of them."""
+
+    def __init__(self, name, run_batch, max_batch=16, max_wait_ms=10):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self.stats = {"items": 0, "batches": 0, "busy_seconds": 0.0}
+        threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True).start()
+
+    def submit(self, item):
+        fut = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            started = time.time()
+            try:
+                results = self.run_batch([item for item, _ in batch])
+                for (_, fut), res in zip(batch, results):
+                    if isinstance(res, Exception):
+                        fut.set_exception(res)  # this item failed, the rest of the batch did not
+                    else:
+                        fut.set_result(res)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+            self.stats["items"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["busy_seconds"] += time.time() - started
+
+
+def detect_files(analyzer, paths):
+    """
+    Object lists for image files. A file the service can't read is an error for that
+    item (the worker then runs YOLO itself), not an empty list that looks like "no objects".
+    """
+    missing = {i for i, p in enumerate(paths) if not os.path.isfile(p)}
+    found = iter(analyzer.detect_objects_batch([p for i, p in enumerate(paths) if i not in missing]))
+    return [FileNotFoundError(f"inference service cannot read {p}") if i in missing else next(found)
+            for i, p in enumerate(paths)]
+
+
+class InferenceServer:
+    def __init__(self, address, analyzer, embed_texts, max_batch=16, max_wait_ms=10):
+        self.address = parse_address(address)
+        self.batchers = {
+            "detect": MicroBatcher("detect", lambda paths: detect_files(analyzer, paths), max_batch, max_wait_ms),
+            "embed": MicroBatcher("embed", lambda texts: list(embed_texts(texts)), max_batch, max_wait_ms),
+        }
+
+    def serve_forever(self):
+        authkey = _authkey(create=True)
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)  # stale socket from a previous run
+        if isinstance(self.address, tuple) and self.address[0] not in ("127.0.0.1", "localhost", "::1"):
+            print(f"Warning: inference service reachable from other hosts on {self.address[0]}")
+        # the socket is created owner-only (no window between bind and chmod)
+        old_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, authkey=authkey)
+        finally:
+            os.umask(old_umask)
+        with listener:
+            print(f"Inference service listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print("Rejected inference client:", e)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        send_lock = threading.Lock()
+
+        def reply(req_id, fut):
+            try:
+                msg = (req_id, True, fut.result())
+            except Exception as e:
+                msg = (req_id, False, str(e))
+            with send_lock:
+                try:
+                    conn.send(msg)
+                except Exception:
+                    pass  # client went away
+
+        try:
+            while True:
+                req_id, kind, payload = conn.recv()
+                if kind == "stats":
+                    with send_lock:
+                        conn.send((req_id, True, {k: b.stats for k, b in self.batchers.items()}))
+                    continue
+                batcher = self.batchers.get(kind)
+                if batcher is None:
+                    with send_lock:
+                        conn.send((req_id, False, f"unknown request {kind}"))
+                    continue
+                # one request may carry several items (e.g. texts); each goes into the batch on its own
+                futures = [batcher.submit(item) for item in payload]
+                self._gather(futures).add_done_callback(lambda f, req_id=req_id: reply(req_id, f))
+        except (EOFError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _gather(futures):
+        combined = Future()
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            try:
+                combined.set_result([f.result() for f in futures])
+            except Exception as e:
+                combined.set_exception(e)
+
+        for f in futures:
+            f.add_done_callback(done)
+        return combined
+
+
+class InferenceClient:
+    """Connection from a web worker to the inference service; safe to share between threads."""
+
+    def __init__(self, address, timeout=60):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 0
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = Client(self.address, authkey=_authkey())
+            threading.Thread(target=self._read_replies, args=(self._conn,), daemon=True).start()
+        return self._conn
+
+    def _read_replies(self, conn):
+        try:
+            while True:
+                req_id, ok, payload = conn.recv()
+                fut = self._pending.pop(req_id, None)
+                if fut is None:
+                    continue
+                if ok:
+                    fut.set_result(payload)
+                else:
+                    fut.set_exception(Exception(payload))
+        except (EOFError, OSError) as e:
+            with self._lock:
+                if self._conn is conn:
+                    self._conn = None
+                pending, self._pending = self._pending, {}
+            for fut in pending.values():
+                fut.set_exception(Exception(f"inference service connection lost: {e}"))
+
+    def _call(self, kind, payload):
+        fut = Future()
+        with self._lock:
+            conn = self._connection()
+            self._next_id += 1
+            req_id = self._next_id
+            self._pending[req_id] = fut
+            conn.send((req_id, kind, payload))
+        return fut.result(timeout=self.timeout)
+
+    def detect_objects(self, filepath):
+        return self._call("detect", [filepath])[0]
+
+    def detect_objects_batch(self, sources):
+        return self._call("detect", list(sources))
+
+    def embed_texts(self, texts):
+        return self._call("embed", list(texts))
+
+    def stats(self):
+        return self._call("stats", None)
+
+
+def main():
+    address = sys.argv[1] if len(sys.argv) > 1 else os.environ.get("TBCH_INFERENCE_ADDRESS", DEFAULT_ADDRESS)
+    from ml_image_analyzer import ImageAnalyzer
+    import semantic_search
+    import lazy_model
+    analyzer = ImageAnalyzer(n_clusters=6)
+    started = time.time()
+    lazy_model.warm_up(background=False)
+    print(f"Models loaded in {time.time() - started:.1f}s")
+    InferenceServer(address, analyzer, semantic_search.embed_texts).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
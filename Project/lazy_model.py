@@ -0,0 +1,79 @@
+import threading
+import time
+
+_registry = []
+
+
+class LazyModel:
+    """
+    Loads an expensive object (ML model) on first use instead of at import time.
+    Thread-safe: concurrent first callers wait for a single load. Every instance is
+    registered so readiness and load times can be reported (see status()).
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self.state = "not loaded"  # -> loading -> ready / failed
+        self.error = None
+        self.load_seconds = None
+        _registry.append(self)
+
+    @property
+    def loaded(self):
+        return self.state == "ready"
+
+    def get(self):
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state == "ready":
+                return self._value
+            if self.state == "failed":
+                raise Exception(f"{self.name} failed to load: {self.error}")
+            self.state = "loading"
+            started = time.time()
+            try:
+                self._value = self._loader()
+            except Exception as e:
+                self.state = "failed"
+                self.error = str(e)
+                self.load_seconds = time.time() - started
+                raise
+            self.load_seconds = time.time() - started
+            self.state = "ready"
+            self.error = None
+            return self._value
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+            self.state = "ready"
+
+    def status(self):
+        return {"state": self.state, "load_seconds": self.load_seconds, "error": self.error}
+
+
+def models_status():
+    return {m.name: m.status() for m in _registry}
+
+
+def warm_up(models=None, background=True):
+    """Load the given models (default: all registered) now, optionally on a background thread."""
+    models = list(models) if models is not None else list(_registry)
+
+    def load_all():
+        for m in models:
+            try:
+                m.get()
+            except Exception as e:
+                print(f"Warm-up of {m.name} failed:", e)
+
+    if not background:
+        load_all()
+        return None
+    t = threading.Thread(target=load_all, name="model-warm-up", daemon=True)
+    t.start()
+    return t
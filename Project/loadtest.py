@@ -0,0 +1,126 @@
+"""
+Requests/second of the server as the number of gunicorn workers grows.
+
+python loadtest.py --workers 1 2 4 --clients 16 --duration 15
+python loadtest.py --url http://127.0.0.1:5000      (load an already running server instead)
+
+For every worker count a server is started with gunicorn (gunicorn.conf.py,
+TBCH_WORKERS=N) in the current directory, so it uses the database and stores found
+there. Each client thread loops over a mix of listing, search, metadata and
+recommendation requests for the given duration.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import requests
+
+MIX = [("list", 4), ("search", 3), ("meta", 2), ("recommendations", 1)]
+
+
+def wait_until_up(url, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url + "/ready", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def login(url, username="loadtest", password="loadtest"):
+    requests.post(url + "/register", json={"username": username, "password": password})
+    r = requests.post(url + "/login", json={"username": username, "password": password})
+    r.raise_for_status()
+    return r.json()["token"]
+
+
+def run_load(url, token, clients, duration):
+    """(requests, errors, latencies) of `clients` threads hammering the server for `duration` seconds."""
+    s = requests.Session()
+    ids = [it["id"] for it in s.get(url + "/images", params={"limit": 200}, headers={"X-Token": token}).json()]
+    words = ["cat", "dog", "red", "car", "person", "beach", "light", "dark"]
+    kinds = [k for k, w in MIX for _ in range(w)]
+    results = []
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        session.headers["X-Token"] = token
+        done, errors, latencies = 0, 0, []
+        while time.time() < stop_at:
+            kind = rng.choice(kinds)
+            if kind == "list":
+                path, params = "/images", {"limit": 50}
+            elif kind == "search":
+                path, params = "/images", {"q": rng.choice(words)}
+            elif kind == "meta" and ids:
+                path, params = f"/image/{rng.choice(ids)}/meta", None
+            else:
+                path, params = "/recommendations", None
+            started = time.time()
+            try:
+                ok = session.get(url + path, params=params, timeout=30).status_code < 500
+            except requests.RequestException:
+                ok = False
+            latencies.append(time.time() - started)
+            done += 1
+            errors += 0 if ok else 1
+        with lock:
+            results.append((done, errors, latencies))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies = sorted(l for _, _, ls in results for l in ls)
+    return sum(r[0] for r in results), sum(r[1] for r in results), latencies
+
+
+def report(label, total, errors, latencies, duration):
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+    print(f"{label:>8} {total / duration:>10.1f} {p50:>9.1f} {p95:>9.1f} {errors:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the image server")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--url", help="test this running server instead of starting gunicorn")
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    if args.url:
+        token = login(args.url)
+        report("-", *run_load(args.url, token, args.clients, args.duration), args.duration)
+        return
+
+    url = f"http://127.0.0.1:{args.port}"
+    for n in args.workers:
+        env = dict(os.environ, TBCH_WORKERS=str(n), TBCH_BIND=f"127.0.0.1:{args.port}")
+        proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_until_up(url):
+                print(f"{n:>8} server did not become ready")
+                continue
+            token = login(url)
+            report(str(n), *run_load(url, token, args.clients, args.duration), args.duration)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import hashlib
+
+# Leaves and inner nodes are hashed with different prefixes so an inner node
+# can never be passed off as a record (second-preimage protection).
+_LEAF = b"\x00"
+_NODE = b"\x01"
+_ROOT = b"\x02"  # root = hash of the leaf count and the tree's top node
+
+
+def leaf_hash(record):
+    return hashlib.sha256(_LEAF + record.encode()).hexdigest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(_NODE + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def _commit(top, leaves):
+    return hashlib.sha256(_ROOT + leaves.to_bytes(8, "big") + bytes.fromhex(top)).hexdigest()
+
+
+def _levels(records):
+    """
+    Hashes of every tree level, leaves first. An odd node at the end of a level is carried
+    up unpaired (RFC 6962), never paired with itself, so [a, b, c] and [a, b, c, c] differ.
+    """
+    level = [leaf_hash(r) for r in records]
+    levels = [level]
+    while len(level) > 1:
+        odd = level[-1:] if len(level) % 2 else []
+        level = [node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)] + odd
+        levels.append(level)
+    return levels
+
+
+def merkle_root(records):
+    if not records:
+        return hashlib.sha256(b"").hexdigest()
+    return _commit(_levels(records)[-1][0], len(records))
+
+
+def merkle_proof(records, index):
+    """Sibling hashes from the leaf at `index` up to the root."""
+    proof = []
+    for level in _levels(records)[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({"hash": level[sibling], "side": "left" if sibling < index else "right"})
+        # else: the last node of an odd level, carried up as it is
+        index //= 2
+    return proof
+
+
+def verify_proof(record, proof, root, leaves):
+    """leaves: the number of records in the block (the root commits to it)."""
+    h = leaf_hash(record)
+    for step in proof:
+        if step["side"] == "left":
+            h = node_hash(step["hash"], h)
+        else:
+            h = node_hash(h, step["hash"])
+    return _commit(h, leaves) == root
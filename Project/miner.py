@@ -0,0 +1,114 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+class MiningCancelled(Exception):
+    pass
+
+
+class MiningResult:
+    def __init__(self, nonce, hash, attempts, elapsed):
+        self.nonce = nonce
+        self.hash = hash
+        self.attempts = attempts
+        self.elapsed = elapsed
+
+    @property
+    def hash_rate(self):
+        return self.attempts / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self):
+        return {"nonce": self.nonce, "hash": self.hash, "attempts": self.attempts,
+                "elapsed": self.elapsed, "hash_rate": self.hash_rate}
+
+
+def search_nonce_range(prefix, start, count, target):
+    """
+    Try nonces [start, start + count). The constant block prefix is hashed once
+    and the sha256 state is copied for every attempt, so only the nonce digits
+    are hashed per try. Returns (nonce, hash, attempts); nonce is None if not found.
+    """
+    base = hashlib.sha256(prefix.encode())
+    for nonce in range(start, start + count):
+        h = base.copy()
+        h.update(str(nonce).encode())
+        digest = h.hexdigest()
+        if digest.startswith(target):
+            return nonce, digest, nonce - start + 1
+    return None, None, count
+
+
+class ProofOfWorkMiner:
+    """
+    Splits the nonce space into chunks and searches them on a process pool.
+    workers=1 searches in the calling process without a pool.
+    """
+
+    def __init__(self, workers=None, chunk_size=20000):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def mine(self, prefix, difficulty, timeout=None, cancel_event=None):
+        """
+        Find a nonce so that sha256(prefix + str(nonce)) starts with `difficulty` zeros.
+        Raises MiningCancelled if cancel_event is set or timeout (seconds) expires first.
+        """
+        target = "0" * difficulty
+        started = time.time()
+        deadline = started + timeout if timeout is not None else None
+
+        def should_stop():
+            if cancel_event is not None and cancel_event.is_set():
+                return "cancelled"
+            if deadline is not None and time.time() > deadline:
+                return "timed out"
+            return None
+
+        if self.workers == 1:
+            attempts = 0
+            start = 0
+            while True:
+                reason = should_stop()
+                if reason:
+                    raise MiningCancelled(f"Mining {reason} after {attempts} attempts")
+                nonce, digest, tried = search_nonce_range(prefix, start, self.chunk_size, target)
+                attempts += tried
+                if nonce is not None:
+                    return MiningResult(nonce, digest, attempts, time.time() - started)
+                start += self.chunk_size
+
+        pool = self._get_pool()
+        next_start = 0
+        attempts = 0
+        pending = set()
+        try:
+            while True:
+                # keep every worker busy with one queued chunk behind it
+                while len(pending) < self.workers * 2:
+                    pending.add(pool.submit(search_nonce_range, prefix, next_start, self.chunk_size, target))
+                    next_start += self.chunk_size
+                done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    nonce, digest, tried = fut.result()
+                    attempts += tried
+                    if nonce is not None:
+                        return MiningResult(nonce, digest, attempts, time.time() - started)
+                reason = should_stop()
+                if reason:
+                    raise MiningCancelled(f"Mining {reason} after {attempts} attempts")
+        finally:
+            for fut in pending:
+                fut.cancel()
@@ -1,14 +1,14 @@
 from PIL import Image
 import numpy as np
+import copy
 import os
 import pickle
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from sklearn.preprocessing import StandardScaler
+from lazy_model import LazyModel
 
 MODEL_PATH = "image_cluster_kmeans.pkl"
 
-from ultralytics import YOLO
-
 class ImageAnalyzer:
     def __init__(self, 
                  n_clusters=6, 
@@ -16,76 +16,185 @@ class ImageAnalyzer:
                  conf_thresh=0.25,
                  img_size=640):
         self.n_clusters = n_clusters
-        self.kmeans = None
-        self.scaler = StandardScaler()
         self.conf_thresh = conf_thresh
         self.img_size = img_size
+        self.yolo_model_name = yolo_model_name
+        self.remote_detector = None  # e.g. InferenceClient.detect_objects; local YOLO is the fallback
+        self.remote_batch_detector = None  # e.g. InferenceClient.detect_objects_batch, for file paths
+        # both models are loaded on first use (or by lazy_model.warm_up)
+        self._clusterer = LazyModel("kmeans", self._load_clusterer)
+        self._yolo = LazyModel("yolo", self._load_yolo)
+        self._model_mtime = None  # of MODEL_PATH when it was last loaded or saved here
 
+    def _load_clusterer(self):
+        # version: bumped on every model change, stored with each image's cluster label
+        # samples_seen: feature-store rows the model was trained on (rows are appended in order)
+        model = {"kmeans": None, "scaler": StandardScaler(), "version": 0, "samples_seen": 0}
         if os.path.exists(MODEL_PATH):
             try:
+                self._model_mtime = os.path.getmtime(MODEL_PATH)
                 with open(MODEL_PATH, "rb") as f:
                     data = pickle.load(f)
-                    self.kmeans = data.get("kmeans")
-                    self.scaler = data.get("scaler", StandardScaler())
+                    model["kmeans"] = data.get("kmeans")
+                    model["scaler"] = data.get("scaler", StandardScaler())
+                    model["version"] = data.get("version", 1 if model["kmeans"] is not None else 0)
+                    model["samples_seen"] = data.get("samples_seen", 0)
             except Exception as e:
                 print("Couldn't load clustering model:", e)
+        return model
+
+    def _load_yolo(self):
+        from ultralytics import YOLO
+        return YOLO(self.yolo_model_name)
+
+    @property
+    def kmeans(self):
+        return self._clusterer.get()["kmeans"]
+
+    @property
+    def scaler(self):
+        return self._clusterer.get()["scaler"]
+
+    @property
+    def model_version(self):
+        return self._clusterer.get()["version"]
+
+    @property
+    def samples_seen(self):
+        return self._clusterer.get()["samples_seen"]
+
+    @property
+    def incremental(self):
+        """True when the current model can be updated with partial_fit (older pickles hold a plain KMeans)."""
+        return hasattr(self.kmeans, "partial_fit")
 
+    @property
+    def yolo(self):
+        if self._yolo.state == "failed":
+            return None
         try:
-            self.yolo = YOLO(yolo_model_name)
+            return self._yolo.get()
         except Exception as e:
-            print(f"Failed to load YOLO11 model {yolo_model_name}: {e}")
-            self.yolo = None
+            print(f"Failed to load YOLO11 model {self.yolo_model_name}: {e}")
+            return None
 
     def fit(self, features):
-        self.scaler = StandardScaler().fit(features)
-        Xs = self.scaler.transform(features)
-        self.kmeans = KMeans(n_clusters=self.n_clusters, random_state=0).fit(Xs)
+        """Train from scratch on all features (n_samples >= n_clusters)."""
+        scaler = StandardScaler().fit(features)
+        kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=0, n_init=3,
+                                 batch_size=256).fit(scaler.transform(features))
+        self._replace(kmeans, scaler, len(features))
+
+    def partial_fit(self, features):
+        """
+        Update the model with new features only. The scaler stays as fitted by the last
+        full fit, so the existing centres keep their meaning.
+        """
+        model = self._clusterer.get()  # one snapshot: kmeans and scaler of the same version
+        if model["kmeans"] is None or not hasattr(model["kmeans"], "partial_fit"):
+            raise Exception("no incremental clustering model yet, call fit() first")
+        kmeans = copy.deepcopy(model["kmeans"])
+        kmeans.partial_fit(model["scaler"].transform(features))
+        self._replace(kmeans, model["scaler"], model["samples_seen"] + len(features))
+
+    def reload_if_changed(self):
+        """Load the saved clustering model if another process has written a new one; True if reloaded."""
+        try:
+            mtime = os.path.getmtime(MODEL_PATH)
+        except OSError:
+            return False
+        if mtime == self._model_mtime:
+            return False
+        model = self._load_clusterer()
+        if model["version"] == self.model_version:
+            return False
+        self._clusterer.set(model)
+        return True
+
+    def _replace(self, kmeans, scaler, samples_seen):
+        # swap everything at once so concurrent predict() calls never mix old and new
+        self._clusterer.set({"kmeans": kmeans, "scaler": scaler,
+                             "version": self.model_version + 1, "samples_seen": samples_seen})
         self._save()
 
     def predict(self, feat):
-        if self.kmeans is None:
+        model = self._clusterer.get()  # one snapshot, so a concurrent _replace can't mix versions
+        if model["kmeans"] is None:
             return None
-        X = self.scaler.transform(feat.reshape(1, -1))
-        return int(self.kmeans.predict(X)[0])
+        X = model["scaler"].transform(feat.reshape(1, -1))
+        return int(model["kmeans"].predict(X)[0])
+
+    def predict_many(self, features):
+        """(labels, version) for an (n, 28) feature matrix; labels is None without a model."""
+        model = self._clusterer.get()
+        if model["kmeans"] is None:
+            return None, model["version"]
+        return model["kmeans"].predict(model["scaler"].transform(features)), model["version"]
 
     def _save(self):
         try:
-            with open(MODEL_PATH, "wb") as f:
-                pickle.dump({"kmeans": self.kmeans, "scaler": self.scaler}, f)
+            model = self._clusterer.get()
+            tmp_path = f"{MODEL_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump({k: model[k] for k in ("kmeans", "scaler", "version", "samples_seen")}, f)
+            os.replace(tmp_path, MODEL_PATH)  # readers in other processes never see a partial file
+            self._model_mtime = os.path.getmtime(MODEL_PATH)
         except Exception as e:
             print("Error saving clustering model:", e)
 
-    def detect_objects(self, filepath):
-        if self.yolo is None:
+    def detect_objects(self, filepath, image=None):
+        """`image` is an already decoded BGR array of the file; local YOLO uses it instead of reading the file."""
+        if self.remote_detector is not None:
+            try:
+                return self.remote_detector(os.path.abspath(filepath))  # the service may run elsewhere
+            except Exception as e:
+                print("Remote detection failed, running YOLO locally:", e)
+        return self.detect_objects_batch([filepath if image is None else image])[0]
+
+    def detect_objects_batch(self, sources):
+        """Run YOLO once over several images (paths or arrays); one object list per image."""
+        if not sources:
             return []
+        if self.remote_batch_detector is not None and all(isinstance(s, str) for s in sources):
+            try:
+                return self.remote_batch_detector([os.path.abspath(s) for s in sources])
+            except Exception as e:
+                print("Remote detection failed, running YOLO locally:", e)
+        if self.yolo is None:
+            return [[] for _ in sources]
 
         try:
-            results = self.yolo(filepath, imgsz=self.img_size, conf=self.conf_thresh)
+            results = self.yolo(list(sources), imgsz=self.img_size, conf=self.conf_thresh, verbose=False)
             if not results:
-                return []
-            r = results[0]
-            names = getattr(r, "names", None)
-            boxes = getattr(r, "boxes", None)
-            if boxes is None or not hasattr(boxes, "data"):
-                return []
-
-            arr = boxes.data.cpu().numpy() if hasattr(boxes.data, "cpu") else np.array(boxes.data)
-            objs = []
-            for b in arr:
-                # b format is like [x1, y1, x2, y2, conf, cls]
-                conf = float(b[4])
-                cls = int(b[5])
-                label = names.get(cls, str(cls)) if names is not None else str(cls)
-                objs.append({"label": label, "confidence": conf})
-            return objs
+                return [[] for _ in sources]
+            return [self._result_objects(r) for r in results]
 
         except Exception as e:
             print("YOLO11 detection failed:", e)
+            return [[] for _ in sources]
+
+    @staticmethod
+    def _result_objects(r):
+        names = getattr(r, "names", None)
+        boxes = getattr(r, "boxes", None)
+        if boxes is None or not hasattr(boxes, "data"):
             return []
 
+        arr = boxes.data.cpu().numpy() if hasattr(boxes.data, "cpu") else np.array(boxes.data)
+        objs = []
+        for b in arr:
+            # b format is like [x1, y1, x2, y2, conf, cls]
+            conf = float(b[4])
+            cls = int(b[5])
+            label = names.get(cls, str(cls)) if names is not None else str(cls)
+            objs.append({"label": label, "confidence": conf})
+        return objs
+
     @staticmethod
     def image_to_feature(img: Image.Image, hist_bins=8):
-        img = img.convert("RGB").resize((128, 128))
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img = img.resize((128, 128))
         arr = np.array(img) / 255.0
         mean_rgb = arr.mean(axis=(0,1)).tolist()
         brightness = (0.299*arr[:,:,0] + 0.587*arr[:,:,1] + 0.114*arr[:,:,2]).mean()
@@ -100,19 +209,32 @@ class ImageAnalyzer:
         feat = np.array([brightness] + mean_rgb + hist)
         return feat
 
-    def analyze_image_file(self, filepath):
+    def analyze_image_file(self, filepath, with_feature=False):
         try:
             pil = Image.open(filepath).convert("RGB")
         except Exception as e:
             raise Exception(f"Cannot open image: {e}")
+        return self.analyze_image(pil, filepath, with_feature)
 
+    def analyze_image(self, pil, filepath=None, with_feature=False):
+        """
+        Analyse a decoded RGB image; the colour features and YOLO share this one decode.
+        With with_feature=True returns (analysis, feature vector).
+        """
         feat = self.image_to_feature(pil)
+        # YOLO takes numpy input as BGR, the same pixels without another decode of the file
+        bgr = np.ascontiguousarray(np.asarray(pil)[:, :, ::-1])
+        objects = self.detect_objects(filepath, image=bgr)
+        analysis = self.analysis_from_feature(feat, objects)
+        return (analysis, feat) if with_feature else analysis
+
+    def analysis_from_feature(self, feat, objects):
+        """Analysis dict for an image whose feature vector and detected objects are already known."""
         mean_rgb = feat[1:4].tolist()
         dom_color = self._dominant_color(mean_rgb)
         brightness = float(feat[0])
         hist = feat[4:].tolist()
-        cluster = self.predict(feat) if self.kmeans is not None else None
-        objects = self.detect_objects(filepath)
+        cluster = self.predict(feat)
 
         return {
             "dominant_color": dom_color,
@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 import json
 
@@ -10,18 +11,27 @@ class User(db.Model):
     username = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256), nullable=False)
     token = db.Column(db.String(64), unique=True, nullable=True)
+    token_expires = db.Column(db.DateTime, nullable=True)  # tokens without an expiry (older logins) are not accepted
 
 class ImageEntry(db.Model):
     __tablename__ = "images"
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(260), nullable=False)
     uploader = db.Column(db.String(120), nullable=False)
-    upload_time = db.Column(db.DateTime, default=datetime.utcnow)
+    upload_time = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # /images pages on (upload_time, id)
+    cluster = db.Column(db.Integer, nullable=True)  # current cluster label (analysis["cluster"] keeps the one at upload)
+    cluster_version = db.Column(db.Integer, nullable=True)  # clustering model version that produced `cluster`
     filepath = db.Column(db.String(400), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the file bytes
     metadata_json = db.Column(db.Text, default="{}")   # user provided metadata
     analysis_json = db.Column(db.Text, default="{}")   # earlier image analysis (brightness, hist, cluster)
     objects_json = db.Column(db.Text, default="[]")    # detected objects by YOLO: [{"label": "...", "confidence": 0.87}, ...]
-    embedding_json = db.Column(db.Text, default="[]")  # semantic embedding for search (JSON array of floats)
+    embedding_json = db.Column(db.Text, default="[]")  # legacy: embeddings now live in the binary EmbeddingStore
+    embedding_sha256 = db.Column(db.String(64), nullable=True)  # digest of the stored float32 embedding
+    chain_status = db.Column(db.String(16), default="pending")  # pending -> committed / failed
+    block_index = db.Column(db.Integer, nullable=True)
+    block_hash = db.Column(db.String(64), nullable=True)
+    block_record = db.Column(db.Integer, nullable=True)  # position of the entry's record inside the block
 
     def get_metadata(self):
         try:
@@ -47,22 +57,94 @@ class ImageEntry(db.Model):
         except:
             return []
 
+def image_entry_to_dict(image_entry):
+    """Record stored on the blockchain for an image."""
+    return {
+        "filename": image_entry.filename,
+        "uploader": image_entry.uploader,
+        "filepath": image_entry.filepath,
+        "content_hash": image_entry.content_hash,
+        "metadata_json": image_entry.metadata_json,
+        "analysis_json": image_entry.analysis_json,
+        "objects_json": image_entry.objects_json,
+        "embedding_sha256": image_entry.embedding_sha256
+    }
+
 class OpenEvent(db.Model):
     __tablename__ = "opens"
     id = db.Column(db.Integer, primary_key=True)
-    user = db.Column(db.String(120), nullable=False)
-    image_id = db.Column(db.Integer, nullable=False)
+    user = db.Column(db.String(120), nullable=False, index=True)
+    image_id = db.Column(db.Integer, nullable=False, index=True)
     ts = db.Column(db.DateTime, default=datetime.utcnow)
 
 class UserPrefs(db.Model):
     """
     Persisted recommender state:
     - prefs_json: cluster counts
-    - profile_embedding_json: aggregated embedding of images user opened
+    - profile_embedding_json: legacy aggregated embedding (now kept in the user EmbeddingStore)
     - views: number of images used to build profile embedding (for incremental averaging)
     """
     __tablename__ = "userprefs"
     user = db.Column(db.String(120), primary_key=True)
     prefs_json = db.Column(db.Text, default="{}")
     profile_embedding_json = db.Column(db.Text, default="[]")
-    views = db.Column(db.Integer, default=0)
\ No newline at end of file
+    views = db.Column(db.Integer, default=0)
+
+class UserRecommendations(db.Model):
+    """Materialized top-K recommendations of a user (see rec_cache.py)."""
+    __tablename__ = "user_recommendations"
+    user = db.Column(db.String(120), primary_key=True)
+    items_json = db.Column(db.Text, default="[]")  # [{"id", "filename", "score", "semantic"}, ...] best first
+    max_image_id = db.Column(db.Integer, default=0)  # newest image that was scored
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+def configure_sqlite(engine, busy_timeout_ms=10000, synchronous="NORMAL"):
+    """
+    Set the pragmas on every new SQLite connection: WAL (readers don't block the writer
+    and commits don't rewrite a rollback journal), a busy timeout so concurrent workers
+    wait for the write lock instead of failing, and NORMAL sync (an fsync per
+    checkpoint rather than per commit; safe in WAL mode).
+    """
+    def on_connect(dbapi_conn, _):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        cur.execute(f"PRAGMA synchronous={synchronous}")
+        cur.close()
+    event.listen(engine, "connect", on_connect)
+
+# Value given to rows that existed before a column was added
+LEGACY_COLUMN_VALUES = {
+    ("images", "chain_status"): "committed",  # uploads used to be mined before the row was written
+}
+
+def upgrade_schema():
+    """
+    Add columns introduced after a table was created (db.create_all only creates missing tables).
+    Returns the (table, column) pairs that were added.
+    """
+    added = []
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing:
+                    continue
+                col_type = col.type.compile(dialect=db.engine.dialect)
+                conn.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}'))
+                added.append((table.name, col.name))
+                legacy = LEGACY_COLUMN_VALUES.get((table.name, col.name))
+                if legacy is not None:
+                    conn.execute(db.text(f"UPDATE {table.name} SET {col.name} = :v"), {"v": legacy})
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+    return added
+
+def backfill_cluster_column():
+    """Fill ImageEntry.cluster from analysis_json for rows written before the column existed."""
+    for img in ImageEntry.query.filter(ImageEntry.cluster.is_(None)).all():
+        img.cluster = img.get_analysis().get("cluster")
+    db.session.commit()
@@ -0,0 +1,178 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from file_lock import FileLock
+from models import db, OpenEvent
+
+
+class OpenEventBuffer:
+    """
+    Write-behind ingestion of image opens. record() appends the event to this buffer's
+    log file (<log_dir>/<pid>-<start time>.log) and an in-memory queue and returns; a worker thread
+    writes the queued events in batches, with the preference and profile updates
+    aggregated per user, in one transaction per batch. A batch's log segment is deleted
+    once it is committed, so segments left by a process that died are replayed at the
+    next start, also when the new process got the same pid (at-least-once: a crash right after a commit can count those opens twice).
+    """
+
+    def __init__(self, app, recommender, image_store, log_dir="open_events", flush_interval=1.0, max_batch=1000,
+                 on_flush=None):
+        self.app = app
+        self.recommender = recommender
+        self.image_store = image_store
+        self.on_flush = on_flush  # called with the usernames of every written batch
+        self.log_dir = log_dir
+        self.flush_interval = flush_interval  # seconds an open may wait before it is written
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()  # guards the log file and the queue, never held during a write
+        self._flush_lock = threading.Lock()
+        self._retry = ([], [])  # events and log segments of a batch whose write failed
+        self._log = None
+        self._name = None  # unique per buffer: a restarted process can reuse the pid (PID 1 in a container)
+        self._segment = 0
+        self._thread = None
+        self.stats = {"recorded": 0, "flushed": 0, "batches": 0, "replayed": 0, "last_flush_seconds": 0.0}
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.log_dir, exist_ok=True)
+            self._name = f"{os.getpid()}-{time.time_ns()}"
+            # held while this process lives, so others know its log is not abandoned
+            self._owner_lock = FileLock(os.path.join(self.log_dir, f"{self._name}.lock"))
+            self._owner_lock.acquire()
+            self._log = open(os.path.join(self.log_dir, f"{self._name}.log"), "a")
+            self._thread = threading.Thread(target=self._run, name="open-events", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+        self.replay_abandoned()
+
+    def record(self, username, image_id, cluster):
+        self.ensure_started()
+        event = {"user": username, "image_id": image_id, "cluster": cluster, "ts": time.time()}
+        with self._lock:
+            self._log.write(json.dumps(event) + "\n")
+            self._log.flush()
+            self._queue.put(event)
+        self.stats["recorded"] += 1
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _run(self):
+        while True:
+            deadline = time.time() + self.flush_interval
+            while self._queue.qsize() < self.max_batch and time.time() < deadline:
+                time.sleep(0.05)
+            try:
+                self.flush()
+            except Exception as e:
+                print("Writing buffered open events failed, will retry:", e)
+
+    def flush(self):
+        """Write everything queued so far; returns the number of events written."""
+        with self._flush_lock:
+            events, segments = self._retry
+            with self._lock:
+                if self._log is not None and not self._queue.empty():
+                    # everything in the queue is in the current log file: close it as a segment
+                    while not self._queue.empty():
+                        events.append(self._queue.get())
+                    self._log.close()
+                    self._segment += 1
+                    segment = os.path.join(self.log_dir, f"{self._name}.{self._segment}.pending")
+                    os.replace(os.path.join(self.log_dir, f"{self._name}.log"), segment)
+                    segments.append(segment)
+                    self._log = open(os.path.join(self.log_dir, f"{self._name}.log"), "a")
+            if not events:
+                return 0
+            started = time.time()
+            try:
+                self._write(events)
+            except Exception:
+                # retried with the next flush; the segments stay for replay after a crash
+                self._retry = (events, segments)
+                raise
+            self._retry = ([], [])
+            for segment in segments:
+                os.remove(segment)
+            self.stats["flushed"] += len(events)
+            self.stats["batches"] += 1
+            self.stats["last_flush_seconds"] = time.time() - started
+            return len(events)
+
+    def _write(self, events):
+        with self.app.app_context():
+            try:
+                db.session.add_all([OpenEvent(user=e["user"], image_id=e["image_id"],
+                                              ts=datetime.utcfromtimestamp(e["ts"])) for e in events])
+                per_user = self._aggregate(events)
+                self.recommender.apply_opens(per_user, commit=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(set(per_user))
+                except Exception as e:
+                    print("Open event flush hook failed:", e)
+
+    def _aggregate(self, events):
+        """username -> (cluster -> opens, sum of opened image embeddings, number of embeddings)."""
+        per_user = {}
+        for e in events:
+            clusters, emb_sum, n = per_user.get(e["user"], ({}, None, 0))
+            if e.get("cluster") is not None:
+                clusters[e["cluster"]] = clusters.get(e["cluster"], 0) + 1
+            emb = self.image_store.get(e["image_id"])
+            if emb is not None:
+                emb = np.asarray(emb, dtype=float)
+                emb_sum = emb.copy() if emb_sum is None else emb_sum + emb
+                n += 1
+            per_user[e["user"]] = (clusters, emb_sum, n)
+        return per_user
+
+    def replay_abandoned(self):
+        """Write the events of log files left behind by buffers whose process is gone."""
+        replayed = 0
+        for path in glob.glob(os.path.join(self.log_dir, "*.lock")):
+            name = os.path.basename(path)[:-len(".lock")]
+            if name == self._name:
+                continue
+            owner = FileLock(path)
+            if not owner.acquire(blocking=False):
+                continue  # that process is still running
+            try:
+                segments = sorted(glob.glob(os.path.join(self.log_dir, f"{name}.*.pending")),
+                                  key=lambda p: int(p.rsplit(".", 2)[1]))
+                segments += glob.glob(os.path.join(self.log_dir, f"{name}.log"))
+                for segment in segments:
+                    events = []
+                    with open(segment) as f:
+                        for line in f:
+                            if line.endswith("\n"):
+                                events.append(json.loads(line))
+                    if events:
+                        self._write(events)
+                    os.remove(segment)
+                    replayed += len(events)
+                os.remove(path)
+            finally:
+                owner.release()
+        if replayed:
+            print(f"Replayed {replayed} buffered open events from a previous run")
+        self.stats["replayed"] += replayed
+        return replayed
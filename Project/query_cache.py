@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_query(q):
+    return " ".join(q.lower().split())
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after `ttl` seconds.
+    An entry can carry a generation; get() with a different generation treats it as stale.
+    Counts hits and misses so the size can be tuned to the real query mix (see stats()).
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, generation, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.expired = self.stale = self.evicted = 0
+
+    def get(self, key, generation=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, gen, value = entry
+            if expires_at < time.time() or gen != generation:
+                del self._data[key]
+                if gen != generation:
+                    self.stale += 1
+                else:
+                    self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, generation, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evicted += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl,
+                "hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired, "stale": self.stale, "evicted": self.evicted}
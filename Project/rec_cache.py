@@ -0,0 +1,125 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from file_lock import FileLock
+from models import db, ImageEntry, User, UserRecommendations
+
+
+class RecommendationCache:
+    """
+    Materialized top-K recommendations per user (user_recommendations table, shared by all workers).
+    A request is a lookup; the list is recomputed when it is older than max_age seconds and
+    extended with only the new images' scores when images were uploaded since. Users whose
+    opens were just written are refreshed by the open-event buffer (refresh_users), and a
+    background thread recomputes the lists of logged-in users before they reach max_age,
+    so recency decay and other users' opens are picked up without a request paying for it.
+    """
+
+    def __init__(self, app, recommender, top_k=50, max_age=900, refresh_interval=300, lock_path="rec_cache.lock"):
+        self.app = app
+        self.recommender = recommender
+        self.top_k = top_k
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self._leader_lock = FileLock(lock_path)  # one worker runs the background refresh
+        self.leader = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "extended": 0, "recomputed": 0, "refreshed_on_open": 0,
+                      "background_refreshed": 0, "last_round_seconds": 0.0}
+
+    def ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="rec-cache", daemon=True)
+            self._thread.start()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["leader"] = self.leader
+        return stats
+
+    def get(self, username, max_n):
+        row = db.session.get(UserRecommendations, username)
+        max_id = self._max_image_id()
+        if row is None or (datetime.utcnow() - row.computed_at).total_seconds() > self.max_age:
+            items = self.refresh(username)
+            self.stats["recomputed"] += 1
+        elif row.max_image_id < max_id:
+            items = self._extend(row, max_id)
+            self.stats["extended"] += 1
+        else:
+            items = json.loads(row.items_json)
+            self.stats["hits"] += 1
+        return items[:max_n]
+
+    def refresh(self, username):
+        """Recompute the user's whole list."""
+        max_id = self._max_image_id()
+        items = self.recommender.recommend_for_user(username, max_n=self.top_k)
+        self._store(username, items, max_id, datetime.utcnow())
+        return items
+
+    def refresh_users(self, usernames):
+        """Recompute the lists of these users that are materialized (the others are built on their next request)."""
+        rows = db.session.query(UserRecommendations.user).filter(UserRecommendations.user.in_(list(usernames))).all()
+        for (username,) in rows:
+            self.refresh(username)
+        self.stats["refreshed_on_open"] += len(rows)
+        return len(rows)
+
+    def _extend(self, row, max_id):
+        """Score only the images uploaded after the list was built and merge them in."""
+        new = self.recommender.recommend_for_user(row.user, max_n=self.top_k, min_id=row.max_image_id)
+        new_ids = {it["id"] for it in new}
+        items = [it for it in json.loads(row.items_json) if it["id"] not in new_ids] + new
+        items.sort(key=lambda it: -it["score"])
+        items = items[:self.top_k]
+        # the older scores are as old as before: keep computed_at so max_age still bounds them
+        self._store(row.user, items, max_id, row.computed_at)
+        return items
+
+    def _store(self, username, items, max_id, computed_at):
+        try:
+            db.session.merge(UserRecommendations(user=username, items_json=json.dumps(items),
+                                                 max_image_id=max_id, computed_at=computed_at))
+            db.session.commit()
+        except Exception as e:
+            # another worker stored the same user's list at the same moment
+            db.session.rollback()
+            print("Could not store recommendations:", e)
+
+    def _max_image_id(self):
+        return db.session.query(db.func.max(ImageEntry.id)).scalar() or 0
+
+    def _run(self):
+        while True:
+            started = time.time()
+            try:
+                with self.app.app_context():
+                    self.run_once()
+            except Exception as e:
+                print("Recommendation refresh failed:", e)
+            self.stats["last_round_seconds"] = time.time() - started
+            time.sleep(max(1.0, self.refresh_interval - (time.time() - started)))
+
+    def run_once(self):
+        """Recompute the lists of logged-in users that would be older than max_age before the next round."""
+        if not self.leader:
+            self.leader = self._leader_lock.acquire(blocking=False)
+            if not self.leader:
+                return 0
+        now = datetime.utcnow()
+        due = now - timedelta(seconds=max(0, self.max_age - self.refresh_interval))
+        rows = (db.session.query(UserRecommendations.user)
+                .join(User, User.username == UserRecommendations.user)
+                .filter(UserRecommendations.computed_at <= due, User.token_expires > now)
+                .order_by(UserRecommendations.computed_at).all())
+        for (username,) in rows:
+            self.refresh(username)
+        self.stats["background_refreshed"] += len(rows)
+        return len(rows)
@@ -2,11 +2,79 @@ import json
 import numpy as np
 from models import UserPrefs, db, ImageEntry, OpenEvent
 from datetime import datetime
-from semantic_search import cosine_sim
+
+
+def score_catalogue(prefs, profile_vec, clusters, age_seconds, open_counts, embeddings, emb_rows):
+    """
+    Score every image at once.
+    clusters: int array, -1 for no cluster; age_seconds: seconds since upload;
+    embeddings: (rows, dim) matrix; emb_rows: each image's row in it, -1 if it has none.
+    Returns (scores, semantic scores).
+    """
+    n = len(clusters)
+    pref_total = sum(prefs.values()) if prefs else 0
+    pref_score = np.zeros(n)
+    if pref_total > 0:
+        for key, count in prefs.items():
+            try:
+                c = int(key.split("_", 1)[1])
+            except (IndexError, ValueError):
+                continue
+            pref_score[clusters == c] = count / pref_total
+    recency_days = np.floor(age_seconds / 86400.0)
+    recency_boost = np.maximum(0, 1 - recency_days / 30.0)
+    sem_score = np.zeros(n)
+    if profile_vec is not None and len(embeddings) > 0:
+        # one matrix-vector product over the whole store, then pick each image's row
+        sims = np.asarray(embeddings @ np.asarray(profile_vec, dtype=np.float32), dtype=float)
+        has_emb = emb_rows >= 0
+        sem_score[has_emb] = sims[emb_rows[has_emb]]
+    score = sem_score * 2.5 + pref_score * 2.0 + recency_boost * 0.5 + np.minimum(open_counts, 10) * 0.05
+    return score, sem_score
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first."""
+    if len(scores) > k:
+        idx = np.argpartition(-scores, k)[:k]
+    else:
+        idx = np.arange(len(scores))
+    return idx[np.argsort(-scores[idx], kind="stable")]
 
 class Recommender:
-    def __init__(self, db_session):
+    def __init__(self, db_session, image_store, user_store):
         self.db = db_session
+        self.image_store = image_store  # image id -> embedding
+        self.user_store = user_store    # username -> profile embedding
+        self._catalogue = None
+        self._catalogue_key = None
+
+    def invalidate_catalogue(self):
+        self._catalogue = None
+
+    def get_catalogue(self):
+        """
+        Column arrays for every image (ids sorted ascending, filenames, upload times, clusters,
+        embedding store rows), rebuilt only when images or embeddings were added or removed,
+        or after invalidate_catalogue().
+        """
+        # cluster versions only grow, so their sum changes whenever images are re-labelled
+        count, max_id, versions = db.session.query(db.func.count(ImageEntry.id), db.func.max(ImageEntry.id),
+                                                   db.func.sum(ImageEntry.cluster_version)).one()
+        key = (count, max_id, versions, len(self.image_store))
+        if self._catalogue is not None and key == self._catalogue_key:
+            return self._catalogue
+        rows = db.session.query(ImageEntry.id, ImageEntry.filename, ImageEntry.upload_time, ImageEntry.cluster).order_by(ImageEntry.id).all()
+        ids = [r[0] for r in rows]
+        self._catalogue = {
+            "ids": np.array(ids, dtype=np.int64),
+            "filenames": [r[1] for r in rows],
+            "upload_ts": np.array([r[2].timestamp() if r[2] else 0.0 for r in rows], dtype=float),
+            "clusters": np.array([r[3] if r[3] is not None else -1 for r in rows], dtype=np.int64),
+            "emb_rows": self.image_store.rows_for(ids),
+        }
+        self._catalogue_key = key
+        return self._catalogue
 
     def get_prefs(self, username):
         up = UserPrefs.query.filter_by(user=username).first()
@@ -18,6 +86,10 @@ class Recommender:
             return {}
 
     def get_profile_embedding(self, username):
+        vec = self.user_store.get(username)
+        if vec is not None:
+            return np.array(vec, dtype=float)
+        # profile saved before the embedding store existed: move it over
         up = UserPrefs.query.filter_by(user=username).first()
         if not up:
             return None
@@ -25,11 +97,12 @@ class Recommender:
             arr = json.loads(up.profile_embedding_json or "[]")
             if not arr:
                 return None
+            self.user_store.put(username, arr)
             return np.array(arr, dtype=float)
         except:
             return None
 
-    def increment_pref(self, username, cluster_label):
+    def increment_pref(self, username, cluster_label, commit=True):
         if cluster_label is None:
             return
         up = UserPrefs.query.filter_by(user=username).first()
@@ -44,61 +117,110 @@ class Recommender:
         key = f"cluster_{cluster_label}"
         prefs[key] = prefs.get(key, 0) + 1
         up.prefs_json = json.dumps(prefs)
-        db.session.commit()
+        if commit:
+            db.session.commit()
 
-    def update_profile_embedding(self, username, image_embedding):
+    def update_profile_embedding(self, username, image_embedding, commit=True):
         if image_embedding is None:
             return
+        current = self.get_profile_embedding(username)
         up = UserPrefs.query.filter_by(user=username).first()
         if not up:
-            up = UserPrefs(user=username, prefs_json=json.dumps({}), profile_embedding_json=json.dumps(image_embedding.tolist()), views=1)
+            up = UserPrefs(user=username, prefs_json=json.dumps({}), profile_embedding_json="[]", views=0)
             db.session.add(up)
-            db.session.commit()
-            return
         try:
-            current = json.loads(up.profile_embedding_json or "[]")
-            if not current:
+            if current is None:
                 # first time
-                up.profile_embedding_json = json.dumps(image_embedding.tolist())
+                self.user_store.put(username, image_embedding)
                 up.views = 1
             else:
-                cur = np.array(current, dtype=float)
                 v = up.views or 0
-                new = (cur * v + image_embedding) / (v + 1)
-                up.profile_embedding_json = json.dumps(new.tolist())
+                new = (current * v + image_embedding) / (v + 1)
+                self.user_store.put(username, new)
                 up.views = v + 1
-            db.session.commit()
+            up.profile_embedding_json = "[]"
+            if commit:
+                db.session.commit()
         except Exception as e:
             print("Failed to update profile embedding:", e)
 
-    def recommend_for_user(self, username, max_n=10):
+    def apply_opens(self, per_user, commit=True):
+        """
+        Preference and profile updates of many opens at once (see open_events.py):
+        per_user maps username -> (cluster -> opens, sum of the opened images' embeddings, how many).
+        Same result as increment_pref/update_profile_embedding per open, one row update per user.
+        """
+        if not per_user:
+            return
+        rows = {up.user: up for up in UserPrefs.query.filter(UserPrefs.user.in_(list(per_user))).all()}
+        for username, (clusters, emb_sum, n) in per_user.items():
+            up = rows.get(username)
+            if not up:
+                up = UserPrefs(user=username, prefs_json=json.dumps({}), profile_embedding_json="[]", views=0)
+                db.session.add(up)
+            if clusters:
+                try:
+                    prefs = json.loads(up.prefs_json)
+                except:
+                    prefs = {}
+                for cluster_label, count in clusters.items():
+                    key = f"cluster_{cluster_label}"
+                    prefs[key] = prefs.get(key, 0) + count
+                up.prefs_json = json.dumps(prefs)
+            if n:
+                try:
+                    current = self.get_profile_embedding(username)
+                    if current is None:
+                        self.user_store.put(username, emb_sum / n)
+                        up.views = n
+                    else:
+                        v = up.views or 0
+                        self.user_store.put(username, (current * v + emb_sum) / (v + n))
+                        up.views = v + n
+                    up.profile_embedding_json = "[]"
+                except Exception as e:
+                    print("Failed to update profile embedding:", e)
+        if commit:
+            db.session.commit()
+
+    def open_counts(self, ids):
+        """Opens per image for a sorted id array, from one GROUP BY query."""
+        counts = np.zeros(len(ids))
+        if len(ids) == 0:
+            return counts
+        rows = (db.session.query(OpenEvent.image_id, db.func.count(OpenEvent.id))
+                .filter(OpenEvent.image_id.between(int(ids[0]), int(ids[-1])))
+                .group_by(OpenEvent.image_id).all())
+        if rows and len(ids):
+            opened = np.array([r[0] for r in rows], dtype=np.int64)
+            n = np.array([r[1] for r in rows], dtype=float)
+            pos = np.clip(np.searchsorted(ids, opened), 0, len(ids) - 1)
+            found = ids[pos] == opened
+            counts[pos[found]] = n[found]
+        return counts
+
+    def recommend_for_user(self, username, max_n=10, min_id=None):
+        """Best max_n images for the user; with min_id only images with a larger id are scored."""
         prefs = self.get_prefs(username)
-        pref_total = sum(prefs.values()) if prefs else 0
         profile_vec = self.get_profile_embedding(username)
-        images = ImageEntry.query.all()
-        scored = []
-        for img in images:
-            analysis = img.get_analysis()
-            cluster = analysis.get("cluster")
-            ckey = f"cluster_{cluster}"
-            pref_score = (prefs.get(ckey, 0) / pref_total) if pref_total>0 else 0
-            recency_days = (datetime.utcnow() - img.upload_time).days
-            recency_boost = max(0, 1 - (recency_days / 30.0))
-            opens_count = OpenEvent.query.filter_by(image_id=img.id).count()
-            sem_score = 0.0
-            try:
-                emb = img.get_embedding()
-                if emb:
-                    img_emb = np.array(emb, dtype=float)
-                    if profile_vec is not None:
-                        sem_score = cosine_sim(profile_vec, img_emb)
-            except:
-                sem_score = 0.0
-
-            score = sem_score * 2.5 + pref_score * 2.0 + recency_boost * 0.5 + min(opens_count,10)*0.05
-            scored.append((score, img, sem_score))
-        scored.sort(key=lambda x: x[0], reverse=True)
+        cat = self.get_catalogue()
+        ids, clusters, upload_ts, emb_rows = cat["ids"], cat["clusters"], cat["upload_ts"], cat["emb_rows"]
+        embeddings = self.image_store.matrix()
+        start = 0
+        if min_id is not None:
+            start = int(np.searchsorted(ids, min_id, side="right"))
+            ids, clusters, upload_ts, emb_rows = ids[start:], clusters[start:], upload_ts[start:], emb_rows[start:]
+            # only the new images' embedding rows are multiplied
+            has_emb = emb_rows >= 0
+            embeddings = embeddings[emb_rows[has_emb]]
+            emb_rows = np.full(len(ids), -1, dtype=np.int64)
+            emb_rows[has_emb] = np.arange(int(has_emb.sum()))
+        if len(ids) == 0:
+            return []
+        age_seconds = datetime.utcnow().timestamp() - upload_ts
+        scores, sem = score_catalogue(prefs, profile_vec, clusters, age_seconds,
+                                      self.open_counts(ids), embeddings, emb_rows)
         result = []
-        for score, img, sem in scored[:max_n]:
-            result.append({"id": img.id, "filename": img.filename, "score": float(score), "semantic": float(sem)})
+        for i in top_k(scores, max_n):
+            result.append({"id": int(ids[i]), "filename": cat["filenames"][start + i], "score": float(scores[i]), "semantic": float(sem[i])})
         return result
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""
+Lexical and fuzzy search over the image library without scanning every row.
+
+SearchIndex keeps an SQLite FTS5 table (images_fts, rowid = image id) with the
+filename, uploader, metadata text and labels (detected objects and dominant colour)
+of each image; it is filled in the same transaction that stores the image. Without
+FTS5 in the sqlite build it falls back to LIKE queries on the images table.
+
+FilenameMatcher keeps normalized filenames in memory for rapidfuzz, loading only
+images added since the last search.
+"""
+import os
+import re
+import threading
+from sqlalchemy import text
+from rapidfuzz import fuzz, process
+from models import ImageEntry
+
+
+def index_fields(image_entry):
+    """(filename, uploader, metadata, labels) text indexed for an image."""
+    md = image_entry.get_metadata()
+    if isinstance(md, dict):
+        metadata = " ".join(f"{k} {v}" for k, v in md.items())
+    else:
+        metadata = str(md)
+    labels = [o.get("label") or "" for o in image_entry.get_objects()]
+    labels.append(image_entry.get_analysis().get("dominant_color") or "")
+    return image_entry.filename or "", image_entry.uploader or "", metadata, " ".join(l for l in labels if l)
+
+
+def query_terms(q):
+    return re.findall(r"\w+", q.lower())
+
+
+class SearchIndex:
+    def __init__(self, db):
+        self.db = db
+        self.fts = None  # decided by ensure(): True with FTS5, False for the LIKE fallback
+
+    def ensure(self):
+        """Create the FTS table if possible and index images stored before it existed."""
+        try:
+            self.db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS images_fts "
+                "USING fts5(filename, uploader, metadata, labels, tokenize='unicode61')"))
+            self.db.session.commit()
+            self.fts = True
+        except Exception as e:
+            self.db.session.rollback()
+            print("SQLite FTS5 not available, lexical search falls back to LIKE:", e)
+            self.fts = False
+            return 0
+        return self.backfill()
+
+    def backfill(self, batch=500):
+        added = 0
+        while True:
+            entries = (ImageEntry.query
+                       .filter(text("images.id NOT IN (SELECT rowid FROM images_fts)"))
+                       .order_by(ImageEntry.id).limit(batch).all())
+            if not entries:
+                return added
+            for ie in entries:
+                self.add(ie)
+            self.db.session.commit()
+            added += len(entries)
+
+    def add(self, image_entry):
+        """Index an image; runs in the caller's transaction, so commit together with the entry."""
+        if not self.fts:
+            return
+        filename, uploader, metadata, labels = index_fields(image_entry)
+        self.db.session.execute(
+            text("INSERT OR REPLACE INTO images_fts(rowid, filename, uploader, metadata, labels) "
+                 "VALUES (:id, :filename, :uploader, :metadata, :labels)"),
+            {"id": image_entry.id, "filename": filename, "uploader": uploader,
+             "metadata": metadata, "labels": labels})
+
+    def search(self, q, limit=200):
+        """Ids of images matching every word of the query (as a prefix), best first."""
+        terms = query_terms(q)
+        if not terms:
+            return []
+        if self.fts:
+            match = " ".join('"%s"*' % t for t in terms)
+            rows = self.db.session.execute(
+                text("SELECT rowid FROM images_fts WHERE images_fts MATCH :match "
+                     "ORDER BY bm25(images_fts) LIMIT :limit"),
+                {"match": match, "limit": limit}).all()
+            return [r[0] for r in rows]
+        haystack = (ImageEntry.filename + " " + ImageEntry.uploader + " " + ImageEntry.metadata_json
+                    + " " + ImageEntry.objects_json + " " + ImageEntry.analysis_json)
+        query = self.db.session.query(ImageEntry.id)
+        for t in terms:
+            query = query.filter(haystack.ilike(f"%{t}%"))
+        return [r[0] for r in query.order_by(ImageEntry.id.desc()).limit(limit).all()]
+
+
+class FilenameMatcher:
+    def __init__(self, db):
+        self.db = db
+        self._ids = []
+        self._names = []
+        self._max_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(name):
+        name = os.path.splitext(name or "")[0].lower()
+        return re.sub(r"[\s_\-.]+", " ", name).strip()
+
+    def refresh(self):
+        """Load filenames of images added since the last call (also by other processes)."""
+        with self._lock:
+            rows = (self.db.session.query(ImageEntry.id, ImageEntry.filename)
+                    .filter(ImageEntry.id > self._max_id).order_by(ImageEntry.id).all())
+            for image_id, filename in rows:
+                self._ids.append(image_id)
+                self._names.append(self.normalize(filename))
+                self._max_id = image_id
+
+    def extract(self, q, limit=10, score_cutoff=60):
+        """(image id, score) of the filenames most similar to the query."""
+        self.refresh()
+        matches = process.extract(self.normalize(q), self._names, scorer=fuzz.WRatio,
+                                  limit=limit, score_cutoff=score_cutoff, processor=None)
+        return [(self._ids[idx], score) for _, score, idx in matches]
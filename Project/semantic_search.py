@@ -1,9 +1,23 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import json
+from lazy_model import LazyModel
 
 _MODEL_NAME = "all-MiniLM-L6-v2"
-_model = SentenceTransformer(_MODEL_NAME)
+
+def _load_model():
+    # imported here so importing this module does not pull in torch
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(_MODEL_NAME)
+
+_model = LazyModel("sentence-transformer", _load_model)
+_remote_encoder = []  # set_remote_encoder(): embed through the inference service instead
+
+def model_ready():
+    return _model.loaded or bool(_remote_encoder)
+
+def set_remote_encoder(encode_texts):
+    """Route embedding through `encode_texts(list_of_str) -> array`; the local model stays the fallback."""
+    _remote_encoder[:] = [encode_texts] if encode_texts else []
 
 def text_from_image_entry(img_entry):
     parts = []
@@ -47,7 +61,16 @@ def text_from_image_entry(img_entry):
     return text
 
 def embed_text(text):
-    emb = _model.encode(text, normalize_embeddings=True)
+    return embed_texts([text])[0]
+
+def embed_texts(texts, batch_size=32):
+    """Embed several texts in one model call; returns an (n, dim) array."""
+    if _remote_encoder:
+        try:
+            return np.asarray(_remote_encoder[0](list(texts)))
+        except Exception as e:
+            print("Remote embedding failed, using the local model:", e)
+    emb = _model.get().encode(list(texts), normalize_embeddings=True, batch_size=batch_size)
     if isinstance(emb, np.ndarray):
         return emb
     return np.array(emb)
@@ -1,40 +1,184 @@
 import os
+import time
+from datetime import datetime
+_startup_clock = [time.time()]
+STARTUP_TIMES = {}
+
+def _mark_startup(phase):
+    """Record how long a startup phase took (for /ready)."""
+    now = time.time()
+    STARTUP_TIMES[phase] = round(now - _startup_clock[0], 3)
+    _startup_clock[0] = now
+
 from flask import Flask, request, jsonify, send_file
-from models import db, User, ImageEntry, OpenEvent, UserPrefs
+from models import (db, User, ImageEntry, UserPrefs, upgrade_schema,
+                    backfill_cluster_column, configure_sqlite)
 from ml_image_analyzer import ImageAnalyzer
 from recommender import Recommender
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from PIL import Image
 import uuid
 import json
+import hashlib
 import numpy as np
-from semantic_search import embed_text, embed_image_entry, text_from_image_entry, cosine_sim
-from rapidfuzz import fuzz, process  # for fuzzy string matching fallback
+from semantic_search import embed_text, embed_image_entry, text_from_image_entry, cosine_sim, model_ready, set_remote_encoder
+from search_index import SearchIndex, FilenameMatcher
+from query_cache import TTLCache, normalize_query
+from session_store import Session, SessionStore
 from blockchain import Blockchain
+from miner import ProofOfWorkMiner
+from commit_queue import BlockCommitQueue
+from open_events import OpenEventBuffer
+from rec_cache import RecommendationCache
+from vector_index import VectorIndex
+from embedding_store import EmbeddingStore
+from content_store import ContentStore, UploadTooLarge, sniff_image_type, HEAD_BYTES
+import lazy_model
+from cluster_job import FEATURE_DIM, ClusterMaintainer
+from inference_service import InferenceClient
+_mark_startup("imports")
 
-
-UPLOAD_FOLDER = "storage/images"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# images are stored once per distinct content (older uploads stay under storage/images)
+content_store = ContentStore("storage/objects")
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///server.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+MAX_UPLOAD_BYTES = int(os.environ.get("TBCH_MAX_UPLOAD_MB", "20")) * 1024 * 1024
+# requests whose Content-Length is above this are refused before the body is read
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES + 64 * 1024
 db.init_app(app)
 
 with app.app_context():
+    configure_sqlite(db.engine, synchronous=os.environ.get("TBCH_SQLITE_SYNCHRONOUS", "NORMAL"))
     db.create_all()
+    if ("images", "cluster") in upgrade_schema():
+        backfill_cluster_column()
+_mark_startup("database")
+
+analyzer = ImageAnalyzer(n_clusters=6)  # YOLO and KMeans load lazily, see start_warm_up()
+# With TBCH_INFERENCE_ADDRESS set, YOLO and MiniLM run in the shared inference service
+# (python inference_service.py) instead of in every web process.
+INFERENCE_ADDRESS = os.environ.get("TBCH_INFERENCE_ADDRESS")
+inference_client = InferenceClient(INFERENCE_ADDRESS) if INFERENCE_ADDRESS else None
+if inference_client is not None:
+    analyzer.remote_detector = inference_client.detect_objects
+    analyzer.remote_batch_detector = inference_client.detect_objects_batch  # bulk_ingest.py
+    set_remote_encoder(inference_client.embed_texts)
+image_embeddings = EmbeddingStore("image_embeddings.f32")
+user_embeddings = EmbeddingStore("user_embeddings.f32")
+# colour/histogram vector of every image, the training data of the clustering model (see cluster_job.py)
+image_features = EmbeddingStore("image_features.f32", dim=FEATURE_DIM)
+recommender = Recommender(db, image_embeddings, user_embeddings)
+blockchain = Blockchain(miner=ProofOfWorkMiner(workers=int(os.environ.get("MINER_WORKERS", "0")) or None),
+                        mining_timeout=120)
+_mark_startup("blockchain")
+commit_queue = BlockCommitQueue(app, blockchain)
+vector_index = VectorIndex(image_embeddings, "vector_index.npz")
+SEMANTIC_TOP_K = 100
+search_index = SearchIndex(db)
+filename_matcher = FilenameMatcher(db)  # fuzzy matching on filenames
+# normalized query -> embedding, and (query, exact) -> ranked [(image id, score)]
+query_embedding_cache = TTLCache(maxsize=int(os.environ.get("TBCH_EMBED_CACHE_SIZE", "2048")), ttl=24 * 3600)
+search_result_cache = TTLCache(maxsize=int(os.environ.get("TBCH_SEARCH_CACHE_SIZE", "512")), ttl=300)
+
+def catalogue_generation():
+    """Grows with every upload (in any process); cached search results from an older generation are dropped."""
+    return db.session.query(db.func.max(ImageEntry.id)).scalar() or 0
+
+def embed_query(q):
+    emb = query_embedding_cache.get(q)
+    if emb is None:
+        emb = embed_text(q)
+        query_embedding_cache.put(q, emb)
+    return emb
+
+IMAGES_PAGE_SIZE = 50  # default /images page without a query
+IMAGES_MAX_PAGE_SIZE = 500
+
+def backfill_embedding_store():
+    """Move embeddings still kept as JSON in the database into the binary store."""
+    ids = [i for (i,) in db.session.query(ImageEntry.id).all()]
+    missing = [i for i in ids if i not in image_embeddings]
+    for start in range(0, len(missing), 500):
+        rows = db.session.query(ImageEntry.id, ImageEntry.embedding_json).filter(ImageEntry.id.in_(missing[start:start + 500])).all()
+        for image_id, emb_json in rows:
+            try:
+                emb = json.loads(emb_json or "[]")
+            except:
+                continue
+            if emb:
+                image_embeddings.put(image_id, emb)
+    vector_index.refresh(train=False)
+
+with app.app_context():
+    backfill_embedding_store()
+    search_index.ensure()
+_mark_startup("embedding_store")
+
+WARM_UP = os.environ.get("TBCH_WARMUP", "1") != "0"
+_warm_up_started = []
+
+def start_warm_up():
+    """Load the ML models in the background so the first upload/search does not pay for it."""
+    if WARM_UP and not _warm_up_started:
+        # with the inference service only the clustering model is needed here
+        models = [analyzer._clusterer] if inference_client is not None else None
+        _warm_up_started.append(lazy_model.warm_up(models))
 
-analyzer = ImageAnalyzer(n_clusters=6)
-recommender = Recommender(db)
-blockchain = Blockchain()
+# trains the clustering model from the feature store as images arrive and re-labels older images
+# (full retrain every TBCH_RETRAIN_INTERVAL seconds, 0 = only via cluster_job.py)
+cluster_maintainer = ClusterMaintainer(app, analyzer, image_features,
+                                       interval=int(os.environ.get("TBCH_CLUSTER_INTERVAL", "30")),
+                                       retrain_interval=int(os.environ.get("TBCH_RETRAIN_INTERVAL", "0")))
+
+# per-user top-K lists; TBCH_RECS_MAX_AGE (seconds) bounds how old a served list may be
+rec_cache = RecommendationCache(app, recommender,
+                                top_k=int(os.environ.get("TBCH_RECS_TOP_K", "50")),
+                                max_age=int(os.environ.get("TBCH_RECS_MAX_AGE", "900")),
+                                refresh_interval=int(os.environ.get("TBCH_RECS_REFRESH_SECONDS", "300")))
+# opens are logged and written in batches; TBCH_OPEN_FLUSH_SECONDS bounds how stale preferences get
+open_events = OpenEventBuffer(app, recommender, image_embeddings,
+                              flush_interval=float(os.environ.get("TBCH_OPEN_FLUSH_SECONDS", "1")),
+                              on_flush=rec_cache.refresh_users)
+
+@app.before_request
+def start_background_workers():
+    # started lazily so only the process that actually serves requests runs them
+    commit_queue.ensure_started()
+    blockchain.ensure_audit_started()
+    start_warm_up()
+    cluster_maintainer.ensure_started()
+    open_events.ensure_started()
+    rec_cache.ensure_started()
+
+TOKEN_TTL = int(os.environ.get("TBCH_TOKEN_TTL_HOURS", "168")) * 3600
+session_store = SessionStore("sessions.db")  # shared by all workers
+# in-process token -> Session; another worker's login reaches it within the TTL
+session_cache = TTLCache(maxsize=10000, ttl=int(os.environ.get("TBCH_SESSION_CACHE_TTL", "30")))
 
 def token_auth():
+    """The Session (user_id, username, expires_at) of the request's X-Token, or None."""
     token = request.headers.get("X-Token")
     if not token:
         return None
-    u = User.query.filter_by(token=token).first()
-    return u
+    s = session_cache.get(token)
+    if s is None:
+        s = session_store.get(token)
+        if s is None:
+            # not in the session store (e.g. it was deleted): the users table is the source of truth
+            u = User.query.filter_by(token=token).first()
+            if u is None or u.token_expires is None:
+                return None
+            s = Session(u.id, u.username, (u.token_expires - datetime(1970, 1, 1)).total_seconds())
+            if s.expires_at < time.time():
+                return None
+            session_store.put(token, s)
+        session_cache.put(token, s)
+    if s.expires_at < time.time():
+        session_cache.delete(token)
+        return None
+    return s
 
 @app.route("/register", methods=["POST"])
 def register():
@@ -59,10 +203,19 @@ def login():
     u = User.query.filter_by(username=username).first()
     if not u or not check_password_hash(u.password_hash, password):
         return jsonify({"error":"invalid"}), 401
+    # a new login replaces the previous token everywhere
+    if u.token:
+        session_cache.delete(u.token)
+    for old in session_store.delete_user(u.id):
+        session_cache.delete(old)
     token = uuid.uuid4().hex
+    expires_at = time.time() + TOKEN_TTL
     u.token = token
+    u.token_expires = datetime.utcfromtimestamp(expires_at)
     db.session.commit()
-    return jsonify({"token": token})
+    session_store.put(token, Session(u.id, u.username, expires_at))
+    session_store.purge_expired()
+    return jsonify({"token": token, "expires_in": TOKEN_TTL})
 
 @app.route("/upload", methods=["POST"])
 def upload():
@@ -78,66 +231,73 @@ def upload():
     
     f = request.files['file']
     filename = secure_filename(f.filename)
-    uid = uuid.uuid4().hex[:8]
-    save_name = f"{uid}_{filename}"
-    filepath = os.path.join(UPLOAD_FOLDER, save_name)
-    f.save(filepath)
+    # check the format from the first bytes before anything is written
+    head = f.stream.read(HEAD_BYTES)
+    ext = sniff_image_type(head)
+    if ext is None:
+        return jsonify({"error":"unsupported file type, expected jpeg/png/gif/bmp/webp"}), 415
     try:
-        analysis = analyzer.analyze_image_file(filepath)
-    except Exception as e:
-        return jsonify({"error":"invalid image file", "exc": str(e)}), 400
-
+        content_hash, filepath, size, is_new = content_store.save_stream(f.stream, ext, max_bytes=MAX_UPLOAD_BYTES, head=head)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
     meta = request.form.get("metadata") or "{}"
-    objs = analysis.get("objects", [])
-    # build semantic embedding from textual description of the image
-    class _Tmp:
-        def __init__(self, filename, uploader, metadata_json, analysis_json, objects_json):
-            self.filename = filename
-            self.uploader = uploader
-            self.metadata_json = metadata_json
-            self.analysis_json = analysis_json
-            self.objects_json = objects_json
-    tmp = _Tmp(filename, u.username, meta, json.dumps(analysis), json.dumps(objs))
-    emb = embed_image_entry(tmp)
-    emb_list = emb.tolist()
-
-    ie = ImageEntry(filename=filename, uploader=u.username, filepath=filepath,
-                    metadata_json=meta, analysis_json=json.dumps(analysis),
-                    objects_json=json.dumps(objs), embedding_json=json.dumps(emb_list))
-    
-    image_data_json = json.dumps(image_entry_to_dict(ie))
-    try:
-        blockchain.add_block(image_data_json)
-    except Exception as e:
-        if os.path.exists(filepath):
-            os.remove(filepath)
 
-        return jsonify({"error": str(e)}), 500
-    
+    # identical bytes were uploaded before: reuse their analysis and embedding, skip the models
+    original = ImageEntry.query.filter_by(content_hash=content_hash).order_by(ImageEntry.id).first()
+    emb = image_embeddings.get(original.id) if original is not None else None
+    if emb is not None:
+        analysis = original.get_analysis()
+        objs = original.get_objects()
+        emb = np.array(emb)
+        feat = image_features.get(original.id)
+        cluster, cluster_version = original.cluster, original.cluster_version
+    else:
+        original = None
+        cluster_version = analyzer.model_version  # read first: a newer model only makes the label look stale
+        try:
+            analysis, feat = analyzer.analyze_image_file(filepath, with_feature=True)
+        except Exception as e:
+            if is_new:
+                content_store.delete(filepath)
+            return jsonify({"error":"invalid image file", "exc": str(e)}), 400
+
+        objs = analysis.get("objects", [])
+        # build semantic embedding from textual description of the image
+        class _Tmp:
+            def __init__(self, filename, uploader, metadata_json, analysis_json, objects_json):
+                self.filename = filename
+                self.uploader = uploader
+                self.metadata_json = metadata_json
+                self.analysis_json = analysis_json
+                self.objects_json = objects_json
+        tmp = _Tmp(filename, u.username, meta, json.dumps(analysis), json.dumps(objs))
+        emb = embed_image_entry(tmp)
+        cluster = analysis.get("cluster")
+        if cluster is None:
+            cluster_version = None
+
+    ie = ImageEntry(filename=filename, uploader=u.username, filepath=filepath, content_hash=content_hash,
+                    cluster=cluster, cluster_version=cluster_version,
+                    metadata_json=meta, analysis_json=json.dumps(analysis),
+                    objects_json=json.dumps(objs),
+                    embedding_sha256=hashlib.sha256(np.asarray(emb, dtype=np.float32).tobytes()).hexdigest(),
+                    chain_status="pending")
     db.session.add(ie)
+    db.session.flush()
+    search_index.add(ie)
     db.session.commit()
+    # mined and appended to the blockchain in the background
+    commit_queue.submit(ie.id)
+    vector_index.add(ie.id, emb)
+    if feat is not None:
+        image_features.put(ie.id, feat)
+    recommender.invalidate_catalogue()
 
-    all_images = ImageEntry.query.all()
-    feats = []
-    for im in all_images:
-        try:
-            img_pil = Image.open(im.filepath)
-            feats.append(analyzer.__class__.image_to_feature(img_pil) if hasattr(analyzer.__class__, "image_to_feature") else None)
-        except:
-            continue
-    
-    return jsonify({"ok":True, "image_id": ie.id, "analysis": analysis})
-
-def image_entry_to_dict(image_entry):
-    return {
-        "filename": image_entry.filename,
-        "uploader": image_entry.uploader,
-        "filepath": image_entry.filepath,
-        "metadata_json": image_entry.metadata_json,
-        "analysis_json": image_entry.analysis_json,
-        "objects_json": image_entry.objects_json,
-        "embedding_json": image_entry.embedding_json
-    }
+    result = {"ok":True, "image_id": ie.id, "analysis": analysis, "content_hash": content_hash,
+              "chain_status": ie.chain_status, "status_url": f"/image/{ie.id}/status"}
+    if original is not None:
+        result["duplicate_of"] = original.id
+    return jsonify(result), 202
 
 @app.route("/images", methods=["GET"])
 def list_images():
@@ -147,53 +307,25 @@ def list_images():
     q = request.args.get("q", "").strip()
     items = []
     
-    all_images = ImageEntry.query.order_by(ImageEntry.upload_time.desc()).all()
     if not q:
-        for img in all_images:
-            items.append({
-                "id": img.id, "filename": img.filename, "uploader": img.uploader,
-                "upload_time": img.upload_time.isoformat()
-            })
-        return jsonify(items)
-
-    qlow = q.lower()
-    lexical_hits = []
-    for img in all_images:
-        combined = " ".join([img.filename or "", img.upload_time.isoformat() if img.upload_time else "", img.uploader or "", img.metadata_json or "", img.analysis_json or ""]).lower()
-        if qlow in combined:
-            lexical_hits.append((1.0, img))  # score 1.0 baseline for lexical hits
-
-    fuzzy_hits = []
-    names = {img.id: img.filename for img in all_images}
-    
-    fuzzy_top = process.extract(q, names, scorer=fuzz.WRatio, limit=10)
-    fuzzy_ids = {t[2] for t in fuzzy_top if t[1] >= 60}  # keep reasonably similar matches
-    for img in all_images:
-        if img.id in fuzzy_ids and (qlow not in (img.filename or "").lower()):
-            fuzzy_hits.append((0.75, img))
+        return list_images_page()
 
-    semantic_hits = []
-    try:
-        q_emb = embed_text(q)
-        for img in all_images:
-            emb_list = img.get_embedding()
-            if emb_list:
-                img_emb = np.array(emb_list, dtype=float)
-                sim = float(np.dot(q_emb, img_emb))
-                if sim > 0.6:  # similarities threshold
-                    semantic_hits.append((sim, img))
-    except Exception as e:
-        # embedding compute failed - skip semantic
-        semantic_hits = []
+    q = normalize_query(q)
+    # approximate top-k from the vector index; ?exact=1 scores every image instead
+    exact = request.args.get("exact", "").lower() in ("1", "true", "yes")
+    generation = catalogue_generation()
+    ranked = search_result_cache.get((q, exact), generation)
+    if ranked is None:
+        ranked, complete = search_ranked(q, exact)
+        if complete:
+            search_result_cache.put((q, exact), ranked, generation)
 
-    combined = {}
-    for score, img in lexical_hits + fuzzy_hits + semantic_hits:
-        prev = combined.get(img.id)
-        if not prev or score > prev[0]:
-            combined[img.id] = (score, img)
-    
-    sorted_items = sorted(combined.values(), key=lambda x: x[0], reverse=True)
-    for score, img in sorted_items:
+    rows = {r.id: r for r in db.session.query(ImageEntry.id, ImageEntry.filename, ImageEntry.uploader, ImageEntry.upload_time)
+            .filter(ImageEntry.id.in_([image_id for image_id, _ in ranked])).all()}
+    for image_id, score in ranked:
+        img = rows.get(image_id)
+        if img is None:
+            continue
         items.append({
             "id": img.id,
             "filename": img.filename,
@@ -203,6 +335,75 @@ def list_images():
         })
     return jsonify(items)
 
+def search_ranked(q, exact=False):
+    """
+    Fused lexical + fuzzy + semantic ranking, [(image id, score)] best first.
+    `complete` is False when the semantic part was skipped, such results are not cached.
+    """
+    # every source gives (image id, score); rows are read only for the ids that are returned
+    lexical_hits = [(image_id, 1.0) for image_id in search_index.search(q)]  # score 1.0 baseline for lexical hits
+    fuzzy_hits = [(image_id, 0.75) for image_id, _ in filename_matcher.extract(q, limit=10, score_cutoff=60)]
+
+    semantic_hits = []
+    complete = True
+    try:
+        if not model_ready():
+            # model still loading: answer with lexical and fuzzy matches only
+            raise Exception("embedding model not loaded yet")
+        q_emb = embed_query(q)
+        semantic_hits = vector_index.search(q_emb, k=SEMANTIC_TOP_K, threshold=0.6, exact=exact)  # similarities threshold
+    except Exception as e:
+        # embedding compute failed - skip semantic
+        semantic_hits = []
+        complete = False
+
+    combined = {}
+    for image_id, score in lexical_hits + fuzzy_hits + semantic_hits:
+        if score > combined.get(image_id, -1.0):
+            combined[image_id] = score
+    return sorted(combined.items(), key=lambda x: x[1], reverse=True), complete
+
+@app.route("/search/stats", methods=["GET"])
+def search_stats():
+    u = token_auth()
+    if not u:
+        return jsonify({"error": "auth required"}), 401
+    return jsonify({"catalogue_generation": catalogue_generation(),
+                    "query_embeddings": query_embedding_cache.stats(),
+                    "results": search_result_cache.stats()})
+
+def encode_cursor(upload_time, image_id):
+    return f"{upload_time.isoformat()}|{image_id}"
+
+def decode_cursor(cursor):
+    t, _, image_id = cursor.rpartition("|")
+    return datetime.fromisoformat(t), int(image_id)
+
+def list_images_page():
+    """
+    One page of the listing, newest first. Keyset pagination on (upload_time, id): the
+    X-Next-Cursor header holds the position of the last item, pass it back as ?cursor=.
+    Only the listed columns are read, never the analysis/metadata text.
+    """
+    try:
+        limit = min(max(int(request.args.get("limit", IMAGES_PAGE_SIZE)), 1), IMAGES_MAX_PAGE_SIZE)
+        cursor = request.args.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "invalid limit or cursor"}), 400
+    query = db.session.query(ImageEntry.id, ImageEntry.filename, ImageEntry.uploader, ImageEntry.upload_time)
+    if after is not None:
+        t, image_id = after
+        query = query.filter(db.or_(ImageEntry.upload_time < t,
+                                    db.and_(ImageEntry.upload_time == t, ImageEntry.id < image_id)))
+    rows = query.order_by(ImageEntry.upload_time.desc(), ImageEntry.id.desc()).limit(limit + 1).all()
+    items = [{"id": r.id, "filename": r.filename, "uploader": r.uploader, "upload_time": r.upload_time.isoformat()}
+             for r in rows[:limit]]
+    resp = jsonify(items)
+    if len(rows) > limit:
+        resp.headers["X-Next-Cursor"] = encode_cursor(rows[limit - 1].upload_time, rows[limit - 1].id)
+    return resp
+
 @app.route("/image/<int:image_id>/download", methods=["GET"])
 def download_image(image_id):
     u = token_auth()
@@ -230,26 +431,47 @@ def image_meta(image_id):
         "analysis": img.analysis_json
     })
 
+@app.route("/image/<int:image_id>/status", methods=["GET"])
+def image_status(image_id):
+    u = token_auth()
+    if not u:
+        return jsonify({"error":"auth required"}), 401
+    img = ImageEntry.query.get(image_id)
+    if not img:
+        return jsonify({"error":"not found"}), 404
+    return jsonify({
+        "id": img.id,
+        "chain_status": img.chain_status,
+        "block_index": img.block_index,
+        "block_hash": img.block_hash,
+        "queue": commit_queue.get_stats()
+    })
+
+@app.route("/image/<int:image_id>/proof", methods=["GET"])
+def image_proof(image_id):
+    u = token_auth()
+    if not u:
+        return jsonify({"error":"auth required"}), 401
+    img = ImageEntry.query.get(image_id)
+    if not img:
+        return jsonify({"error":"not found"}), 404
+    if img.chain_status != "committed" or img.block_index is None:
+        return jsonify({"error": "not on the blockchain yet", "chain_status": img.chain_status}), 409
+    proof = blockchain.get_record_proof(img.block_index, img.block_record)
+    if proof is None:
+        return jsonify({"error": "block not found"}), 404
+    return jsonify(proof)
+
 @app.route("/image/<int:image_id>/open", methods=["POST"])
 def open_event(image_id):
     u = token_auth()
     if not u:
         return jsonify({"error":"auth required"}), 401
-    img = ImageEntry.query.get(image_id)
+    img = db.session.query(ImageEntry.id, ImageEntry.cluster).filter_by(id=image_id).first()
     if not img:
         return jsonify({"error":"not found"}), 404
-    oe = OpenEvent(user=u.username, image_id=image_id)
-    db.session.add(oe)
-    db.session.commit()
-    analysis = img.get_analysis()
-    cluster = analysis.get("cluster")
-    recommender.increment_pref(u.username, cluster)
-    try:
-        emb = img.get_embedding()
-        if emb:
-            recommender.update_profile_embedding(u.username, np.array(emb, dtype=float))
-    except Exception as e:
-        print("Could not update profile embedding:", e)
+    # the event, preference and profile updates are written behind, batched per user
+    open_events.record(u.username, image_id, img.cluster)
     return jsonify({"ok":True})
 
 @app.route("/recommendations", methods=["GET"])
@@ -257,7 +479,7 @@ def recommendations():
     u = token_auth()
     if not u:
         return jsonify({"error":"auth required"}), 401
-    recs = recommender.recommend_for_user(u.username, max_n=3)
+    recs = rec_cache.get(u.username, 3)
     return jsonify(recs)
 
 @app.route("/blockchain/integrity", methods=["GET"])
@@ -266,9 +488,76 @@ def blockchain_integrity():
     if not u:
         return jsonify({"error": "auth required"}), 401
 
-    valid = blockchain.check_integrity()
-    result = {"valid": valid}
+    full = request.args.get("full", "").lower() in ("1", "true", "yes")
+    valid = blockchain.check_integrity(full=full)
+    result = {"valid": valid, "full_audit": full, "scheduled_audits": blockchain.audit_stats}
     return jsonify(result)
 
+@app.route("/blockchain/retry", methods=["POST"])
+def blockchain_retry():
+    """Queue uploads whose chain commit gave up (chain_status "failed") again."""
+    u = token_auth()
+    if not u:
+        return jsonify({"error": "auth required"}), 401
+    requeued = commit_queue.requeue_failed()
+    commit_queue.ensure_started()
+    return jsonify({"requeued": requeued})
+
+@app.route("/blockchain/prove", methods=["GET", "POST"])
+def blockchain_prove():
+    """
+    Is this image on the chain? Look up by content_hash, filepath, filename or block_hash
+    (query parameters), or POST the file itself to look up its SHA-256.
+    """
+    u = token_auth()
+    if not u:
+        return jsonify({"error": "auth required"}), 401
+    content_hash = request.args.get("content_hash")
+    if request.method == "POST":
+        if 'file' not in request.files:
+            return jsonify({"error": "file required"}), 400
+        h = hashlib.sha256()
+        for chunk in iter(lambda: request.files['file'].stream.read(1 << 16), b""):
+            h.update(chunk)
+        content_hash = h.hexdigest()
+    block_hash = request.args.get("block_hash")
+    if block_hash:
+        block = blockchain.find_block(block_hash)
+        if block is None:
+            return jsonify({"found": False}), 404
+        return jsonify({"found": True, "block": blockchain.block_to_dict(block)})
+    filepath = request.args.get("filepath")
+    filename = request.args.get("filename")
+    if not (content_hash or filepath or filename):
+        return jsonify({"error": "content_hash, filepath, filename, block_hash or file required"}), 400
+    proofs = blockchain.find_record_proofs(filepath=filepath, filename=filename, content_hash=content_hash)
+    return jsonify({"found": bool(proofs), "content_hash": content_hash, "proofs": proofs}), (200 if proofs else 404)
+
+@app.route("/blockchain/stats", methods=["GET"])
+def blockchain_stats():
+    u = token_auth()
+    if not u:
+        return jsonify({"error": "auth required"}), 401
+    return jsonify(blockchain.get_cache_stats())
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 200 once the ML models are loaded, 503 while they are still loading."""
+    models = lazy_model.models_status()
+    if inference_client is not None:
+        models = {"kmeans": models["kmeans"]}
+        try:
+            models["inference_service"] = {"state": "ready", "stats": inference_client.stats()}
+        except Exception as e:
+            models["inference_service"] = {"state": "failed", "error": str(e)}
+    ok = all(m["state"] in ("ready", "failed") for m in models.values())
+    return jsonify({"ready": ok, "models": models, "startup_seconds": STARTUP_TIMES,
+                    "clustering": cluster_maintainer.get_stats(),
+                    "open_events": open_events.get_stats(),
+                    "recommendations": rec_cache.get_stats()}), (200 if ok else 503)
+
 if __name__ == "__main__":
+    # the debug reloader runs this module twice; only warm up in the process that serves
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warm_up()
     app.run(host="0.0.0.0", port=5000, debug=True)
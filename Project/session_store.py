@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+Session = namedtuple("Session", "user_id username expires_at")
+
+
+class SessionStore:
+    """
+    Login sessions (token -> user) in a small SQLite file of their own, shared by every
+    server worker on the machine, so token checks don't touch the main database.
+    """
+
+    def __init__(self, path="sessions.db"):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (token TEXT PRIMARY KEY, user_id INTEGER NOT NULL, "
+                         "username TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_user_id ON sessions (user_id)")
+
+    def _conn(self):
+        # one connection per thread (and process: never reuse one inherited through fork);
+        # WAL lets readers in other workers proceed during writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, token):
+        """The session for a token, or None if unknown or expired."""
+        row = self._conn().execute("SELECT user_id, username, expires_at FROM sessions WHERE token = ?",
+                                   (token,)).fetchone()
+        if row is None or row[2] < time.time():
+            return None
+        return Session(*row)
+
+    def put(self, token, session):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO sessions (token, user_id, username, expires_at) VALUES (?, ?, ?, ?)",
+                         (token, session.user_id, session.username, session.expires_at))
+
+    def delete_user(self, user_id):
+        """Drop every session of a user; returns their tokens."""
+        with self._conn() as conn:
+            tokens = [r[0] for r in conn.execute("SELECT token FROM sessions WHERE user_id = ?", (user_id,))]
+            conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        return tokens
+
+    def purge_expired(self):
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),)).rowcount
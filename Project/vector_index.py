@@ -0,0 +1,204 @@
+import os
+import threading
+import numpy as np
+from file_lock import FileLock
+
+
+class VectorIndex:
+    """
+    Approximate nearest-neighbour index (IVF) over the normalized embeddings in an
+    EmbeddingStore. Vectors are grouped into `nlist` clusters by k-means; a query is
+    only scored against the vectors of its `nprobe` closest clusters. Until enough
+    vectors exist to train, or with exact=True, search falls back to brute force.
+    New vectors are added incrementally and the clustering is retrained in the background
+    when the collection has doubled since the last training. Only the clustering is saved
+    to `path`; the vectors themselves live in the store.
+    """
+
+    def __init__(self, store, path="vector_index.npz", nprobe=4, min_train_size=256):
+        self.store = store
+        self.path = path
+        self.dim = store.dim
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self._lock = threading.Lock()
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int64)  # store row -> list
+        self.trained_size = 0
+        self._training_pid = None  # process running a training thread; a forked child has none
+        self._lists = {}
+        self.load()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __contains__(self, image_id):
+        return int(image_id) in self.store
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            data = np.load(self.path)
+            centroids = data["centroids"]
+            self.centroids = centroids if centroids.size else None
+            self.assignments = data["assignments"][:len(self.store)]
+            self.trained_size = int(data["trained_size"])
+        except Exception as e:
+            print("Couldn't load vector index, starting untrained:", e)
+            self.centroids = None
+            self.assignments = np.zeros(0, dtype=np.int64)
+            return
+        with self._lock:
+            self._assign_new_rows()
+            self._build_lists()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        # rows added after a save are re-assigned from the centroids on load
+        tmp_path = f"{self.path}.{os.getpid()}.tmp.npz"
+        with FileLock(self.path + ".lock"):
+            np.savez(tmp_path,
+                     centroids=self.centroids if self.centroids is not None else np.zeros((0, self.dim), dtype=np.float32),
+                     assignments=self.assignments, trained_size=self.trained_size)
+            os.replace(tmp_path, self.path)
+
+    def _build_lists(self):
+        self._lists = {}
+        if self.centroids is None:
+            return
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+        for c in range(len(self.centroids)):
+            self._lists[c] = order[bounds[c]:bounds[c + 1]]
+
+    def _assign_new_rows(self):
+        """Put store rows added since the last assignment into their closest list."""
+        if self.centroids is None:
+            return False
+        done = len(self.assignments)
+        if done >= len(self.store):
+            return False
+        new = np.argmax(self.store.matrix()[done:] @ self.centroids.T, axis=1).astype(np.int64)
+        self.assignments = np.concatenate([self.assignments, new])
+        return True
+
+    def add(self, image_id, vector):
+        with self._lock:
+            row = self.store.put(int(image_id), vector)
+            if self.centroids is not None and row < len(self.assignments):
+                # vector replaced in place: move it to its new list
+                self.assignments[row] = int(np.argmax(self.centroids @ self.store.matrix()[row]))
+                self._build_lists()
+            else:
+                done = len(self.assignments)
+                if self._assign_new_rows():
+                    if len(self.assignments) - done == 1:
+                        c = int(self.assignments[row])
+                        self._lists[c] = np.append(self._lists.get(c, np.zeros(0, dtype=np.int64)), row)
+                    else:
+                        self._build_lists()  # other workers' rows came along
+            self._start_training()
+
+    def refresh(self, train=True):
+        """
+        Assign vectors that were put into the store directly (e.g. by a backfill).
+        train=False at import: a training thread started in the gunicorn master would not
+        exist in the forked workers, so the first add() or search() in a worker starts it.
+        """
+        with self._lock:
+            if self._assign_new_rows():
+                self._build_lists()
+            if train:
+                self._start_training()
+
+    def _start_training(self):
+        """(Re)train on first reaching min_train_size, then whenever the collection doubles."""
+        n = len(self.store)
+        if self._training_pid == os.getpid() or n < self.min_train_size or n < 2 * self.trained_size:
+            return
+        self._training_pid = os.getpid()
+        threading.Thread(target=self._train, name="vector-index-train", daemon=True).start()
+
+    def _train(self, iterations=10):
+        """k-means without holding the lock; searches use the old clustering until the new one is swapped in."""
+        try:
+            self._swap_in(*self._kmeans(iterations))
+        except Exception as e:
+            print("Training the vector index failed:", e)
+        finally:
+            self._training_pid = None
+
+    def _kmeans(self, iterations):
+        X = np.array(self.store.matrix())
+        n = len(X)
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        centroids = X[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(X @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = X[assign == c]
+                if len(members) == 0:
+                    centroids[c] = X[rng.integers(n)]
+                    continue
+                m = members.sum(axis=0)
+                norm = np.linalg.norm(m)
+                centroids[c] = m / norm if norm > 0 else m
+        centroids = centroids.astype(np.float32)
+        return centroids, np.argmax(X @ centroids.T, axis=1).astype(np.int64)
+
+    def _swap_in(self, centroids, assignments):
+        with self._lock:
+            self.centroids = centroids
+            self.assignments = assignments
+            self.trained_size = len(assignments)
+            self._assign_new_rows()  # rows added while training
+            self._build_lists()
+            self._save()
+
+    def search(self, query, k=50, threshold=None, exact=False):
+        """Top-k (id, score) pairs by dot product, highest first; scores <= threshold are dropped."""
+        q = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            matrix = self.store.matrix()
+            if self._assign_new_rows():
+                self._build_lists()  # rows added by another worker
+            self._start_training()
+            if len(matrix) == 0:
+                return []
+            if exact or self.centroids is None:
+                scores = matrix @ q
+                rows = np.arange(len(matrix))
+            else:
+                probe = np.argsort(-(self.centroids @ q))[:self.nprobe]
+                rows = np.concatenate([self._lists.get(int(c), np.zeros(0, dtype=np.int64)) for c in probe])
+                if len(rows) == 0:
+                    return []
+                scores = matrix[rows] @ q
+        if threshold is not None:
+            keep = scores > threshold
+            scores, rows = scores[keep], rows[keep]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            scores, rows = scores[top], rows[top]
+        order = np.argsort(-scores)
+        return [(int(self.store.key_at(rows[i])), float(scores[i])) for i in order]
+
+    def measure_recall(self, k=10, samples=100):
+        """Share of the exact top-k that the approximate search also returns, using stored vectors as queries."""
+        n = len(self.store)
+        if n == 0:
+            return 1.0
+        rng = np.random.default_rng(1)
+        matrix = self.store.matrix()
+        hits = total = 0
+        for r in rng.choice(n, min(samples, n), replace=False):
+            exact = {i for i, _ in self.search(matrix[r], k=k, exact=True)}
+            approx = {i for i, _ in self.search(matrix[r], k=k)}
+            hits += len(exact & approx)
+            total += len(exact)
+        return hits / total if total else 1.0
@@ -0,0 +1,17 @@
+"""
+WSGI entry point for running the server with several worker processes:
+
+gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app (see gunicorn.conf.py) this module is imported once in the master
+process, so the ML models loaded here are shared copy-on-write by all workers.
+The chain, the vector stores and the chain index are shared through file locks;
+sessions through sessions.db.
+"""
+import os
+import lazy_model
+from server import app, inference_client
+
+if os.environ.get("TBCH_PRELOAD_MODELS", "1") != "0" and inference_client is None:
+    # load before the workers are forked; with the inference service they don't need YOLO/MiniLM
+    lazy_model.warm_up(background=False)